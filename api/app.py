@@ -4,8 +4,10 @@ from typing import Optional
 import sys
 import os
 
-# Add project root to path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add project root to path (and src/, so the pickled feature store resolves)
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'src'))
 
 from src.predict import ModelService
 
@@ -42,6 +44,9 @@ class PredictionRequest(BaseModel):
     AQ_Ozone: Optional[float] = None
     AQ_NO2: Optional[float] = None
     
+    # Prediction date (YYYY-MM-DD); fills temporal, lag and rolling features
+    date: Optional[str] = None
+    
     # Temporal features
     month: Optional[int] = None
     day: Optional[int] = None
@@ -49,7 +54,7 @@ class PredictionRequest(BaseModel):
     quarter: Optional[int] = None
     season: Optional[int] = None
     
-    # Borough (one-hot encoded)
+    # Borough (encoded one-hot or as an integer code, per the model's transformer)
     borough: Optional[str] = None  # "brooklyn", "bronx", "manhattan", "queens", "staten island"
     
     # Lag features
@@ -92,17 +97,14 @@ def predict(request: PredictionRequest):
         # Convert Pydantic model to dict (Pydantic v2 compatible)
         input_dict = request.model_dump(exclude_none=True)
         
-        # Handle borough one-hot encoding
-        if 'borough' in input_dict:
-            borough = input_dict['borough'].lower().strip()
-            valid_boroughs = ['brooklyn', 'bronx', 'manhattan', 'queens', 'staten island']
-            if borough in valid_boroughs:
-                # Add one-hot encoded borough columns
-                for b in valid_boroughs:
-                    input_dict[f'borough_{b.replace(" ", "_")}'] = 1 if b == borough else 0
-            del input_dict['borough']
+        # Fill history features from the feature store; explicit values win
+        if 'date' in input_dict:
+            date = input_dict.pop('date')
+            if 'borough' in input_dict:
+                stored = model_service.history_features(date, input_dict['borough'])
+                input_dict = {**stored, **input_dict}
         
-        # Make predictions
+        # Make predictions (the model's transformer encodes borough)
         result = model_service.predict(input_dict)
         
         return {
@@ -10,12 +10,16 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python entrypoint.py [train|serve|predict]")
+        print("Usage: python entrypoint.py [train|serve|predict|ingest|tune|backtest|retrain]")
         print("")
         print("Commands:")
         print("  train  - Run the ML training pipeline")
         print("  serve  - Start the FastAPI server")
         print("  predict - Make a prediction (requires additional args)")
+        print("  ingest - Watch the drop directory for new daily readings (--once to run one pass)")
+        print("  tune   - Search hyperparameters with successive halving on the validation year")
+        print("  backtest - Score both models on rolling-origin folds over the processed panel")
+        print("  retrain - Update the saved models with newly appended days (warm start)")
         sys.exit(1)
     
     command = sys.argv[1].lower()
@@ -55,9 +59,37 @@ def main():
         # We'll implement this in Step 6
         print("Prediction endpoint not yet implemented. Use 'serve' and call API.")
     
+    elif command == "ingest":
+        print("=" * 60)
+        print("STARTING INGESTION")
+        print("=" * 60)
+        from src.ingest import run_ingest
+        run_ingest(once="--once" in sys.argv[2:])
+    
+    elif command == "tune":
+        print("=" * 60)
+        print("STARTING HYPERPARAMETER TUNING")
+        print("=" * 60)
+        from src.tune import run_tuning
+        run_tuning()
+    
+    elif command == "backtest":
+        print("=" * 60)
+        print("STARTING BACKTEST")
+        print("=" * 60)
+        from src.backtest import run_backtest
+        run_backtest()
+    
+    elif command == "retrain":
+        print("=" * 60)
+        print("STARTING INCREMENTAL RETRAINING")
+        print("=" * 60)
+        from src.retrain import run_retrain
+        run_retrain()
+    
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: train, serve, predict")
+        print("Available commands: train, serve, predict, ingest, tune, backtest, retrain")
         sys.exit(1)
 
 
@@ -151,6 +151,7 @@ if submit_button:
     
     # Prepare request data (only date and borough)
     request_data = {
+        "date": selected_date.isoformat(),
         "month": month,
         "day": day,
         "day_of_week": day_of_week,
@@ -0,0 +1,222 @@
+"""
+Model Artifacts - Versioned, memory-mappable format shared by training and serving
+"""
+import io
+import os
+import json
+import math
+import pickle
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from transformer import FeatureTransformer
+
+FORMAT_VERSION = 1
+ALIGNMENT = 64  # Byte alignment of each array in arrays.bin
+POINTER = "CURRENT"  # File naming the published version under the artifact root
+
+# Version directory layout
+MANIFEST = "manifest.json"
+ARRAYS = "arrays.bin"
+OBJECTS = "objects.pkl"
+
+
+def data_hash(*arrays):
+    """sha256 of the bytes of arrays/Series (identifies the training data)."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array.to_numpy() if hasattr(array, 'to_numpy') else array)
+        digest.update(str((array.dtype.str, array.shape)).encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+class ArrayPacker(pickle.Pickler):
+    """Pickler that writes numeric arrays to one aligned blob instead of the stream.
+
+    The stream keeps an (offset, dtype index, shape) reference per array, so
+    on load every array is a view into a single read-only memory map. The
+    distinct dtypes are collected in `dtypes` (trees share a handful).
+    """
+
+    def __init__(self, file, blob):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blob = blob
+        self.dtypes = {}
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray and not isinstance(obj, np.memmap):
+            return None
+        if obj.dtype.hasobject or obj.nbytes == 0:
+            return None
+        offset, descr, shape = pack_array(self.blob, obj)
+        index = self.dtypes.setdefault(obj.dtype, len(self.dtypes))
+        return offset, index, shape
+
+
+class ArrayUnpacker(pickle.Unpickler):
+    """Resolves ArrayPacker references to views of the array blob."""
+
+    def __init__(self, file, blob, dtypes):
+        super().__init__(file)
+        self.blob = blob
+        self.dtypes = [np.lib.format.descr_to_dtype(descr) for descr in dtypes]
+
+    def persistent_load(self, pid):
+        offset, index, shape = pid
+        dtype = self.dtypes[index]
+        return np.frombuffer(self.blob, dtype=dtype, count=math.prod(shape), offset=offset).reshape(shape)
+
+
+def pack_array(blob, array):
+    """Append an array to the blob (aligned); return (offset, dtype descr, shape)."""
+    blob.write(b"\0" * (-blob.tell() % ALIGNMENT))
+    offset = blob.tell()
+    blob.write(memoryview(np.ascontiguousarray(array)).cast('B'))
+    return offset, np.lib.format.dtype_to_descr(array.dtype), tuple(array.shape)
+
+
+def unpack_array(blob, offset, descr, shape):
+    """View of a packed array in the blob."""
+    dtype = np.lib.format.descr_to_dtype(descr)
+    return np.frombuffer(blob, dtype=dtype, count=math.prod(shape), offset=offset).reshape(shape)
+
+
+def model_metadata(model, model_type):
+    """Manifest entry for an estimator."""
+    params = {k: v for k, v in model.get_params().items()
+              if isinstance(v, (bool, int, float, str, type(None)))}
+    return {'model_type': model_type, 'class': type(model).__name__, 'params': params}
+
+
+def resolve(path):
+    """Version directory for an artifact root (via CURRENT) or a version directory."""
+    pointer = os.path.join(path, POINTER)
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def save_artifact(root, classifier, regressor, transformer, config, feature_store=None,
+                  history=None, training_data=None, scaled=True, keep=3):
+    """Write a new artifact version under `root` and publish it.
+
+    The version directory is written in full before CURRENT is switched to
+    it, so loaders never see a partial artifact, and processes that still
+    map an older version keep a valid file until it is pruned (only the
+    newest `keep` versions are kept).
+
+    Returns:
+        path of the new version directory
+    """
+    training_data = training_data or {}
+    created = pd.Timestamp.now()
+    version = f"{created.strftime('%Y%m%dT%H%M%S%f')}-{training_data.get('hash', '')[:8] or 'nohash'}"
+    tmp_dir = os.path.join(root, f".{version}.tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    with open(os.path.join(tmp_dir, ARRAYS), 'wb') as blob:
+        arrays = {
+            'mean': pack_array(blob, transformer.mean),
+            'scale': pack_array(blob, transformer.scale),
+        }
+        stream = io.BytesIO()
+        packer = ArrayPacker(stream, blob)
+        packer.dump({
+            'classifier': classifier, 'regressor': regressor, 'feature_store': feature_store
+        })
+    with open(os.path.join(tmp_dir, OBJECTS), 'wb') as f:
+        # dtype table first, then the object stream that indexes into it
+        pickle.dump([np.lib.format.dtype_to_descr(dtype) for dtype in packer.dtypes], f)
+        f.write(stream.getvalue())
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created_at': created.isoformat(timespec='seconds'),
+        'transformer': transformer.describe(),
+        'scaled': bool(scaled),
+        'arrays': {name: {'offset': offset, 'dtype': descr, 'shape': list(shape)}
+                   for name, (offset, descr, shape) in arrays.items()},
+        'models': {
+            'classifier': model_metadata(classifier, config["classification"]["model_type"]),
+            'regressor': model_metadata(regressor, config["regression"]["model_type"]),
+        },
+        'training_data': training_data,
+        'history': history or [],
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    os.replace(tmp_dir, os.path.join(root, version))
+    pointer_tmp = os.path.join(root, f"{POINTER}.tmp")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(root, POINTER))
+
+    versions = sorted(name for name in os.listdir(root) if not name.startswith(".")
+                      and os.path.isfile(os.path.join(root, name, MANIFEST)))
+    for name in versions[:-keep] if keep else []:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return os.path.join(root, version)
+
+
+def load_artifact(path, mmap=True):
+    """Load an artifact: a root with CURRENT, a version directory, or a legacy models.pkl.
+
+    With mmap, arrays.bin is mapped read-only. Arrays that stay views of
+    the map (HistGradientBoosting predictor nodes, feature store buffers)
+    are shared through the page cache by worker processes on one host.
+    sklearn's Tree.__setstate__ copies node and value arrays into private
+    memory, so GradientBoosting and RandomForest trees are not shared.
+    Without mmap, arrays are read into writable memory (needed to keep
+    training the models, as retrain does).
+
+    Returns:
+        dict with classifier, regressor, transformer, feature_cols,
+        feature_store, history, scaled and manifest
+    """
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            legacy = pickle.load(f)
+        transformer = legacy.get('transformer') or FeatureTransformer.from_scaler(
+            legacy['feature_cols'], legacy['scaler']
+        )
+        return {
+            'classifier': legacy['classifier'], 'regressor': legacy['regressor'],
+            'transformer': transformer, 'feature_cols': legacy['feature_cols'],
+            'feature_store': legacy.get('feature_store'), 'history': legacy.get('history', []),
+            'scaled': legacy['scaler'] is not None, 'manifest': None
+        }
+
+    version_dir = resolve(path)
+    with open(os.path.join(version_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')} "
+                         f"in {version_dir} (expected {FORMAT_VERSION})")
+
+    blob_path = os.path.join(version_dir, ARRAYS)
+    if mmap:
+        blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+    else:
+        blob = bytearray(os.path.getsize(blob_path))
+        with open(blob_path, 'rb') as f:
+            f.readinto(blob)
+    with open(os.path.join(version_dir, OBJECTS), 'rb') as f:
+        dtypes = pickle.load(f)
+        objects = ArrayUnpacker(f, blob, dtypes).load()
+
+    arrays = {name: unpack_array(blob, spec['offset'], spec['dtype'], spec['shape'])
+              for name, spec in manifest['arrays'].items()}
+    transformer = FeatureTransformer.from_description(
+        manifest['transformer'], arrays['mean'], arrays['scale']
+    )
+    return {
+        'classifier': objects['classifier'], 'regressor': objects['regressor'],
+        'transformer': transformer, 'feature_cols': transformer.feature_cols,
+        'feature_store': objects['feature_store'], 'history': manifest['history'],
+        'scaled': manifest['scaled'], 'manifest': manifest
+    }
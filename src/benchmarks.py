@@ -0,0 +1,455 @@
+"""
+Benchmarks - Time and memory comparisons for pipeline stages
+
+Usage (from src/):
+    python benchmarks.py ingest
+    python benchmarks.py impute
+    python benchmarks.py reshape
+    python benchmarks.py features
+    python benchmarks.py serving
+    python benchmarks.py splits
+    python benchmarks.py engines
+    python benchmarks.py artifacts
+"""
+import os
+import sys
+import time
+import pickle
+import tempfile
+import multiprocessing
+import warnings
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_loader import load_config, sync_data, read_dataset, load_data, DATE_INDEX_COLS
+from preprocessing import preprocess_data
+from feature_engineering import create_features, create_target
+from engines import make_model
+from sklearn.metrics import roc_auc_score, r2_score
+from preprocessing import impute_missing, pivot_pollutants
+from feature_engineering import grid_features, grid_feature_names
+from transformer import FeatureTransformer
+from train import prepare_splits
+from sklearn.preprocessing import StandardScaler
+from concurrent.futures import ProcessPoolExecutor
+from artifacts import save_artifact, load_artifact
+
+
+def measure(fn, *args, **kwargs):
+    """Run fn twice; return (result, seconds, peak traced MB).
+    
+    The peak comes from a run under tracemalloc, the time from a separate
+    untraced run (tracing slows allocation-heavy code several times over).
+    """
+    tracemalloc.start()
+    fn(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return result, elapsed, peak / 1e6
+
+
+def bench_ingest(config):
+    """Compare the legacy full-CSV read with the schema-driven read."""
+    print("BENCHMARK: CSV INGEST (legacy vs schema)")
+    sync_data(config)
+    
+    legacy_config = {**config, "data": {**config["data"], "schema": {}, "cache": {}}}
+    schema_config = {**config, "data": {**config["data"], "cache": {}}}
+    
+    rows = []
+    for key in DATE_INDEX_COLS:
+        for label, cfg in [("legacy", legacy_config), ("schema", schema_config)]:
+            df, seconds, peak_mb = measure(read_dataset, cfg, key)
+            rows.append({
+                'dataset': key, 'mode': label, 'columns': df.shape[1],
+                'seconds': round(seconds, 3), 'peak_mb': round(peak_mb, 1),
+                'frame_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1)
+            })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def make_panel(n_groups, n_days, n_cols, missing=0.2, seed=0):
+    """Synthetic (borough, Date) frame with randomly missing numeric columns."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(n_groups * n_days, n_cols))
+    values[rng.random(values.shape) < missing] = np.nan
+    df = pd.DataFrame(values, columns=[f"AQ_{i}" for i in range(n_cols)])
+    df.insert(0, 'borough', np.repeat([f"geo_{g}" for g in range(n_groups)], n_days))
+    df.insert(0, 'Date', np.tile(pd.date_range("2017-01-01", periods=n_days), n_groups))
+    return df
+
+
+def impute_legacy(df):
+    """Per-column, per-borough lambda fill (the original impute_missing)."""
+    df = df.sort_values(['borough', 'Date']).reset_index(drop=True)
+    for col in df.select_dtypes(include=[np.number]).columns:
+        df[col] = df.groupby('borough')[col].transform(lambda x: x.ffill().bfill())
+        if df[col].isnull().sum() > 0:
+            df[col] = df[col].fillna(df[col].mean())
+    return df
+
+
+def bench_impute(config, n_days=365, legacy_limit=100000):
+    """Scale imputation over columns x geography groups.
+    
+    The legacy version is only timed while columns x groups stays under
+    legacy_limit; beyond that it takes minutes.
+    """
+    print("BENCHMARK: IMPUTATION (legacy lambda vs grouped fill)")
+    
+    rows = []
+    for n_cols in (10, 100, 300):
+        for n_groups in (5, 100, 1000):
+            df = make_panel(n_groups, n_days, n_cols)
+            start = time.perf_counter()
+            result = impute_missing(df)
+            vectorized = time.perf_counter() - start
+            
+            legacy = np.nan
+            if n_cols * n_groups <= legacy_limit:
+                start = time.perf_counter()
+                expected = impute_legacy(df)
+                legacy = time.perf_counter() - start
+                pd.testing.assert_frame_equal(result, expected)
+            
+            rows.append({
+                'columns': n_cols, 'groups': n_groups, 'rows': len(df),
+                'legacy_s': round(legacy, 3), 'grouped_s': round(vectorized, 3),
+                'speedup': round(legacy / vectorized, 1)
+            })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def make_air_quality(n_indicators, n_geos, n_days, seed=0):
+    """Synthetic long-format air-quality export (one row per reading)."""
+    rng = np.random.default_rng(seed)
+    n = n_indicators * n_geos * n_days
+    return pd.DataFrame({
+        'Date': np.tile(pd.date_range("2017-01-01", periods=n_days), n_indicators * n_geos),
+        'borough': np.tile(np.repeat([f"geo_{g}" for g in range(n_geos)], n_days), n_indicators),
+        'Name': pd.Categorical(np.repeat([f"Indicator {i}" for i in range(n_indicators)], n_geos * n_days)),
+        'Data Value': rng.normal(10, 3, size=n).astype(np.float32),
+    })
+
+
+def bench_reshape(config):
+    """Compare pivot_table with the factorize + bincount reshape."""
+    print("BENCHMARK: AIR QUALITY RESHAPE (pivot_table vs codes)")
+    
+    rows = []
+    for n_indicators, n_geos in ((5, 5), (20, 50), (50, 200)):
+        df = make_air_quality(n_indicators, n_geos, n_days=365)
+        pivot, pivot_s, pivot_mb = measure(
+            df.pivot_table, index=['Date', 'borough'], columns='Name',
+            values='Data Value', aggfunc='mean', observed=True
+        )
+        codes, codes_s, codes_mb = measure(pivot_pollutants, df)
+        np.testing.assert_allclose(pivot.to_numpy(), codes.iloc[:, 2:].to_numpy(), rtol=1e-6)
+        rows.append({
+            'indicators': n_indicators, 'geos': n_geos, 'readings': len(df),
+            'pivot_s': round(pivot_s, 3), 'codes_s': round(codes_s, 3),
+            'pivot_peak_mb': round(pivot_mb, 1), 'codes_peak_mb': round(codes_mb, 1)
+        })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def grid_features_pandas(df, grid):
+    """Per-feature groupby/rolling reference for a feature grid."""
+    out = {}
+    grouped = df.groupby('borough', sort=False)
+    for name, col, kind, params in grid_feature_names(grid, available=df.columns):
+        if kind == 'lag':
+            out[name] = grouped[col].shift(params[0])
+        else:
+            window, shift, agg = params
+            out[name] = grouped[col].transform(
+                lambda s: getattr(s.rolling(window, min_periods=1), agg)().shift(shift)
+            )
+    return pd.DataFrame(out)
+
+
+def bench_features(config, legacy_limit=100):
+    """Scale a 3 columns x 3 lags x 3 windows x 3 aggs grid over geographies.
+    
+    The per-feature pandas version is only timed up to legacy_limit groups.
+    """
+    print("BENCHMARK: LAG/ROLLING GRID (per-feature pandas vs panel)")
+    grid = [{'columns': ['AQ_0', 'AQ_1', 'AQ_2'], 'lags': [1, 7, 14],
+             'windows': [7, 30, 91], 'aggs': ['mean', 'max', 'std'], 'shift': 3}]
+    
+    rows = []
+    for n_groups in (5, 100, 1000):
+        df = make_panel(n_groups, 3 * 365, 3, missing=0.05)
+        result, panel_s, panel_mb = measure(grid_features, df, grid)
+        
+        pandas_s = np.nan
+        if n_groups <= legacy_limit:
+            expected, pandas_s, _ = measure(grid_features_pandas, df, grid)
+            np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-6, atol=1e-9)
+        
+        rows.append({
+            'groups': n_groups, 'rows': len(df), 'features': result.shape[1],
+            'pandas_s': round(pandas_s, 3), 'panel_s': round(panel_s, 3),
+            'panel_peak_mb': round(panel_mb, 1)
+        })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def prepare_features_legacy(input_data, feature_cols, scaler):
+    """One-row DataFrame, per-column fill and scaler.transform (the original)."""
+    df = pd.DataFrame([input_data])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        for col in feature_cols:
+            if col not in df.columns:
+                df[col] = 0
+    return scaler.transform(df[feature_cols].fillna(0))
+
+
+def bench_serving(config, n_requests=200):
+    """Per-request feature preparation: DataFrame path vs compiled transformer."""
+    print("BENCHMARK: SERVING FEATURE PREPARATION (DataFrame vs transformer)")
+    boroughs = config["preprocessing"]["valid_boroughs"]
+    
+    rows = []
+    for n_numeric in (25, 100, 400):
+        feature_cols = [f"f_{i}" for i in range(n_numeric)] + [f"borough_{b}" for b in boroughs]
+        rng = np.random.default_rng(0)
+        scaler = StandardScaler().fit(pd.DataFrame(rng.normal(size=(100, len(feature_cols))),
+                                                   columns=feature_cols))
+        transformer = FeatureTransformer.from_scaler(feature_cols, scaler)
+        
+        request = {f"f_{i}": float(i) for i in range(0, n_numeric, 2)}
+        legacy_request = {**request, f"borough_{boroughs[0]}": 1}
+        request['borough'] = boroughs[0]
+        np.testing.assert_allclose(
+            transformer.transform(request),
+            prepare_features_legacy(legacy_request, feature_cols, scaler)
+        )
+        
+        _, legacy_s, _ = measure(
+            lambda: [prepare_features_legacy(legacy_request, feature_cols, scaler)
+                     for _ in range(n_requests)])
+        _, compiled_s, _ = measure(lambda: [transformer.transform(request) for _ in range(n_requests)])
+        _, batch_s, _ = measure(transformer.transform, [request] * n_requests)
+        
+        rows.append({
+            'features': len(feature_cols),
+            'dataframe_us': round(legacy_s / n_requests * 1e6, 1),
+            'compiled_us': round(compiled_s / n_requests * 1e6, 1),
+            'batch_us_per_row': round(batch_s / n_requests * 1e6, 1)
+        })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def prepare_splits_legacy(df, config):
+    """Masked float64 copies of each split, all scaled (the original)."""
+    feature_cols = [c for c in df.columns if c not in ('Date', 'Total_Hospitalization', 'High_Risk')]
+    X = df[feature_cols].fillna(0)
+    years = df['Date'].dt.year
+    masks = [years.isin(config["split"]["train_years"]),
+             years == config["split"]["val_year"], years == config["split"]["test_year"]]
+    X_train, X_val, X_test = (X[mask] for mask in masks)
+    scaler = StandardScaler()
+    return scaler.fit_transform(X_train), scaler.transform(X_val), scaler.transform(X_test)
+
+
+def make_training_frame(n_rows, n_cols, seed=0):
+    """Synthetic featured frame spanning the configured split years."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, n_cols)), columns=[f"f_{i}" for i in range(n_cols)])
+    df['Date'] = pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 8 * 365, n_rows), unit='D')
+    df['Total_Hospitalization'] = rng.poisson(400, n_rows).astype(float)
+    df['High_Risk'] = (df['Total_Hospitalization'] > 410).astype(int)
+    return df
+
+
+def bench_splits(config, n_cols=100):
+    """Peak memory of split preparation: legacy float64 copies vs one float32 buffer."""
+    print("BENCHMARK: SPLIT MATRICES (masked float64 copies vs float32 views)")
+    
+    rows = []
+    for n_rows in (100000, 500000):
+        df = make_training_frame(n_rows, n_cols)
+        _, legacy_s, legacy_mb = measure(prepare_splits_legacy, df, config)
+        for scale in (True, False):
+            cfg = {**config, "split": {**config["split"], "scale": scale, "memmap_dir": None}}
+            _, seconds, peak_mb = measure(prepare_splits, df, cfg)
+            rows.append({
+                'rows': n_rows, 'scaled': scale,
+                'legacy_s': round(legacy_s, 2), 'legacy_peak_mb': round(legacy_mb, 1),
+                'views_s': round(seconds, 2), 'views_peak_mb': round(peak_mb, 1)
+            })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def bench_engines(config, scales=(1, 10, 100), legacy_limit=10):
+    """Fit/predict time and test metrics per engine on our data, with the
+    training rows replicated 1x/10x/100x.
+    
+    GradientBoosting is only timed up to legacy_limit x (it is single-threaded
+    and takes minutes beyond that).
+    """
+    print("BENCHMARK: MODEL ENGINES (GradientBoosting vs HistGradientBoosting)")
+    df = preprocess_data(*load_data(config), config)
+    df = create_target(create_features(df, config), config)
+    
+    rows = []
+    for family in ("GradientBoosting", "HistGradientBoosting"):
+        cfg = {**config,
+               "classification": {**config["classification"], "model_type": f"{family}Classifier"},
+               "regression": {**config["regression"], "model_type": f"{family}Regressor"},
+               "split": {**config["split"], "memmap_dir": None}}
+        splits = prepare_splits(df, cfg)
+        
+        for task, target, score in (("classification", 'y_class', roc_auc_score),
+                                    ("regression", 'y_reg', r2_score)):
+            for scale in scales:
+                if family == "GradientBoosting" and scale > legacy_limit:
+                    continue
+                X_train = np.tile(splits['X_train'], (scale, 1))
+                y_train = np.tile(splits[f'{target}_train'].to_numpy(), scale)
+                model = make_model(cfg[task], splits['categorical_features'])
+                
+                start = time.perf_counter()
+                model.fit(X_train, y_train)
+                fit_s = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                if task == "classification":
+                    y_score = model.predict_proba(splits['X_test'])[:, 1]
+                else:
+                    y_score = model.predict(splits['X_test'])
+                predict_s = time.perf_counter() - start
+                
+                rows.append({
+                    'task': task, 'engine': type(model).__name__, 'scale': f"{scale}x",
+                    'train_rows': len(X_train), 'fit_s': round(fit_s, 2),
+                    'predict_ms': round(predict_s * 1e3, 1),
+                    'metric': 'auroc' if task == "classification" else 'r2',
+                    'score': round(score(splits[f'{target}_test'], y_score), 4)
+                })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+def anonymous_mb():
+    """Private (anonymous) memory of this process, from /proc (NaN elsewhere)."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = next(int(line.split()[1]) for line in f if line.startswith("Anonymous:"))
+        return kb / 1e3
+    except (OSError, StopIteration):
+        return float('nan')
+
+
+def load_footprint(path, legacy):
+    """In a fresh process: load time and private memory added by loading and
+    predicting once (pickle: all private; artifact: arrays stay file-backed)."""
+    before = anonymous_mb()
+    start = time.perf_counter()
+    if legacy:
+        with open(path, 'rb') as f:
+            artifacts = pickle.load(f)
+    else:
+        artifacts = load_artifact(path)
+    seconds = time.perf_counter() - start
+    X = np.zeros((1, len(artifacts['feature_cols'])))
+    artifacts['classifier'].predict_proba(X)
+    artifacts['regressor'].predict(X)
+    return seconds, anonymous_mb() - before
+
+
+def bench_artifacts(config, n_rows=50000, n_cols=30, rounds=300, repeats=3):
+    """Cold load time and per-process private memory: pickled dict vs the
+    versioned artifact, for GradientBoosting and HistGradientBoosting."""
+    print("BENCHMARK: MODEL ARTIFACTS (pickle vs memory-mapped artifact)")
+    df = make_training_frame(n_rows, n_cols)
+    feature_cols = [c for c in df.columns if c.startswith('f_')]
+    X = df[feature_cols].to_numpy(dtype=np.float32)
+    transformer = FeatureTransformer.from_scaler(feature_cols, None)
+    spawn = multiprocessing.get_context("spawn")
+    
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for family in ("GradientBoosting", "HistGradientBoosting"):
+            params = {"n_estimators": rounds, "max_leaf_nodes": 255, "random_state": 42}
+            cfg = {**config,
+                   "classification": {"model_type": f"{family}Classifier", "params": params},
+                   "regression": {"model_type": f"{family}Regressor", "params": params}}
+            models = {}
+            for name, task, target in (("classifier", "classification", 'High_Risk'),
+                                       ("regressor", "regression", 'Total_Hospitalization')):
+                model = make_model(cfg[task])
+                if 'early_stopping' in model.get_params():
+                    model.set_params(early_stopping=False)
+                rows_used = n_rows if family.startswith("Hist") else n_rows // 5
+                models[name] = model.fit(X[:rows_used], df[target].iloc[:rows_used])
+            
+            legacy_path = os.path.join(tmp, f"{family}.pkl")
+            with open(legacy_path, 'wb') as f:
+                pickle.dump({**models, 'scaler': None, 'feature_cols': feature_cols}, f)
+            root = os.path.join(tmp, family)
+            save_artifact(root, models['classifier'], models['regressor'], transformer, cfg, scaled=False)
+            
+            for fmt, path, legacy in (("pickle", legacy_path, True), ("artifact", root, False)):
+                results = []
+                for _ in range(repeats):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                        results.append(pool.submit(load_footprint, path, legacy).result())
+                size = (os.path.getsize(path) if legacy else
+                        sum(os.path.getsize(os.path.join(dirpath, name))
+                            for dirpath, _, names in os.walk(root) for name in names))
+                rows.append({
+                    'engine': family, 'format': fmt, 'size_mb': round(size / 1e6, 1),
+                    'load_ms': round(min(s for s, _ in results) * 1e3, 1),
+                    'private_mb': round(min(mb for _, mb in results), 1)
+                })
+    
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
+
+
+BENCHMARKS = {
+    'ingest': bench_ingest,
+    'impute': bench_impute,
+    'reshape': bench_reshape,
+    'features': bench_features,
+    'serving': bench_serving,
+    'splits': bench_splits,
+    'engines': bench_engines,
+    'artifacts': bench_artifacts,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmarks.py [{'|'.join(BENCHMARKS)}] [config_path]")
+        sys.exit(1)
+    config = load_config(sys.argv[2] if len(sys.argv) > 2 else None)
+    BENCHMARKS[sys.argv[1]](config)
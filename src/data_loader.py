@@ -2,9 +2,42 @@
 Data Loader - Downloads and loads data from GCS
 """
 import os
+import json
+import base64
+import hashlib
+import glob
+import shutil
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import yaml
-from google.cloud import storage
+
+try:
+    from google.cloud import storage
+except ImportError:  # Only needed for gs:// buckets, not local stand-ins
+    storage = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar cache is disabled without pyarrow
+    pa = None
+
+MANIFEST_NAME = ".gcs_manifest.json"
+
+# Column holding the date index in each raw CSV (by position)
+DATE_INDEX_COLS = {"weather": 1, "respiratory": 6, "asthma": 6, "air_quality": 6}
+
+# Raw column holding the borough in each dataset (used for partitioning)
+BOROUGH_COLS = {
+    "weather": "borough", "respiratory": "Dim1Value",
+    "asthma": "Dim1Value", "air_quality": "Geo Place Name"
+}
+
+_storage_client = None
+_client_lock = threading.Lock()
 
 def setup_credentials():
     """Setup GCS credentials from file or environment variable."""
@@ -61,14 +94,62 @@ def load_config(config_path=None):
     return config
 
 
+class LocalDirectoryBlob:
+    """Local file that exposes the GCS blob attributes we rely on."""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.generation = None
+        self.md5_hash = None
+
+    def reload(self):
+        """Refresh generation/md5 metadata from the file on disk."""
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"{self.name} not found in {os.path.dirname(self.path)}")
+        md5 = hashlib.md5()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                md5.update(block)
+        self.generation = os.stat(self.path).st_mtime_ns
+        self.md5_hash = base64.b64encode(md5.digest()).decode("ascii")
+
+    def download_to_filename(self, destination):
+        shutil.copyfile(self.path, destination)
+
+
+class LocalDirectoryBucket:
+    """Directory on disk standing in for a GCS bucket (tests, offline runs)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def blob(self, name):
+        return LocalDirectoryBlob(os.path.join(self.root, name), name)
+
+
+def get_storage_client():
+    """Return the shared GCS client, creating it on first use."""
+    global _storage_client
+    with _client_lock:
+        if _storage_client is None:
+            if storage is None:
+                raise ImportError("google-cloud-storage is required to download from GCS")
+            setup_credentials()
+            _storage_client = storage.Client()
+    return _storage_client
+
+
+def get_bucket(bucket_name):
+    """Return a bucket handle; 'file://' names map to a local directory."""
+    if bucket_name.startswith("file://"):
+        return LocalDirectoryBucket(bucket_name[len("file://"):])
+    return get_storage_client().bucket(bucket_name)
+
+
 def download_from_gcs(bucket_name, source_blob, destination):
     """Download a single file from GCS."""
-    # Setup credentials before accessing GCS
-    setup_credentials()
-    
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(source_blob)
+    blob = get_bucket(bucket_name).blob(source_blob)
     
     # Create destination directory if it doesn't exist
     os.makedirs(os.path.dirname(destination), exist_ok=True)
@@ -78,53 +159,414 @@ def download_from_gcs(bucket_name, source_blob, destination):
     print(f"✓ Downloaded {source_blob}")
 
 
-def load_data(config):
-    """Load all datasets from cloud storage."""
-     
-    print("LOADING DATA FROM CLOUD")
+def read_manifest(local_path):
+    """Read the local download manifest (blob generation/md5 per file)."""
+    manifest_path = os.path.join(local_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(local_path, manifest):
+    """Atomically write the local download manifest."""
+    os.makedirs(local_path, exist_ok=True)
+    manifest_path = os.path.join(local_path, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def sync_file(bucket, filename, local_file, known):
+    """Download one file unless the local copy matches the blob's generation/md5.
+    
+    Returns (manifest_entry, downloaded).
+    """
+    blob = bucket.blob(filename)
+    try:
+        blob.reload()
+    except Exception as e:
+        # Offline or no credentials: fall back to whatever is on disk
+        if os.path.exists(local_file):
+            print(f"⚠ Could not check {filename} ({e}); using local copy")
+            return known, False
+        raise
     
+    remote = {"generation": str(blob.generation), "md5_hash": blob.md5_hash}
+    if os.path.exists(local_file) and known:
+        # A re-upload of identical bytes bumps the generation but not the md5
+        same_md5 = remote["md5_hash"] and known.get("md5_hash") == remote["md5_hash"]
+        if known == remote or same_md5:
+            return remote, False
     
-    bucket = config["data"]["bucket_name"]
+    # Download next to the target and swap in, so readers never see a partial file
+    os.makedirs(os.path.dirname(local_file) or ".", exist_ok=True)
+    tmp_file = f"{local_file}.part"
+    blob.download_to_filename(tmp_file)
+    os.replace(tmp_file, local_file)
+    return remote, True
+
+
+def sync_data(config):
+    """Bring local copies of all data files up to date with the bucket.
+    
+    Files are checked and downloaded concurrently over one shared client;
+    only files whose generation/md5 changed since the last sync are fetched.
+    """
+    bucket_name = config["data"]["bucket_name"]
     local_path = config["data"]["local_path"]
     files = config["data"]["files"]
+    max_workers = config["data"].get("download_workers", len(files)) or 1
+    
+    bucket = get_bucket(bucket_name)
+    manifest = read_manifest(local_path)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        futures = {
+            filename: pool.submit(
+                sync_file, bucket, filename,
+                os.path.join(local_path, filename), manifest.get(filename)
+            )
+            for filename in files.values()
+        }
+        results = {filename: future.result() for filename, future in futures.items()}
+    
+    for filename, (entry, downloaded) in results.items():
+        print(f"✓ Downloaded {filename}" if downloaded else f"{filename} is up to date")
+        if entry is not None:
+            manifest[filename] = entry
+    write_manifest(local_path, manifest)
+    
+    n_downloaded = sum(downloaded for _, downloaded in results.values())
+    print(f"✓ Data in sync ({n_downloaded} of {len(files)} files downloaded)")
+    return manifest
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def data_fingerprint(config):
+    """Content hashes of the local data files, keyed by dataset."""
+    local_path = config["data"]["local_path"]
+    return {
+        key: file_digest(os.path.join(local_path, filename))
+        for key, filename in config["data"]["files"].items()
+    }
+
+
+def read_csv_cached(path, read_kwargs, cache_config=None, reader=pd.read_csv):
+    """Read a CSV through an on-disk columnar (Parquet/Feather) cache.
+    
+    The cache file is keyed by the CSV's content hash plus the read arguments,
+    so edits to either invalidate it. Later reads memory-map the columnar file
+    instead of re-parsing (and re-inferring dates in) the CSV.
+    """
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", False):
+        return reader(path, **read_kwargs)
+    if pa is None:
+        print("⚠ pyarrow not installed; reading CSV without cache")
+        return reader(path, **read_kwargs)
     
-    # Download files if not present locally
-    for key, filename in files.items():
-        local_file = f"{local_path}/{filename}"
-        if not os.path.exists(local_file):
-            download_from_gcs(bucket, filename, local_file)
+    fmt = cache_config.get("format", "parquet")
+    if fmt not in ("parquet", "feather"):
+        raise ValueError(f"Unknown cache format: {fmt}")
+    cache_dir = cache_config.get("dir", "data/cache")
+    
+    key_source = json.dumps(
+        {"digest": file_digest(path), "read_kwargs": read_kwargs},
+        sort_keys=True, default=str
+    )
+    key = hashlib.sha256(key_source.encode()).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(path))[0]
+    cache_file = os.path.join(cache_dir, f"{base}-{key}.{fmt}")
+    
+    if os.path.exists(cache_file):
+        if fmt == "feather":
+            table = feather.read_table(cache_file, memory_map=True)
         else:
-            print(f"{filename} already exists locally")
+            table = pq.read_table(cache_file, memory_map=True)
+        print(f"✓ Cache hit: {os.path.basename(cache_file)}")
+        return table.to_pandas()
+    
+    df = reader(path, **read_kwargs)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        # e.g. object columns holding mixed str/int values
+        print(f"⚠ Could not cache {os.path.basename(path)}: {e}")
+        return df
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.tmp"
+    if fmt == "feather":
+        feather.write_feather(table, tmp_file)
+    else:
+        pq.write_table(table, tmp_file)
+    os.replace(tmp_file, cache_file)
+    
+    # Drop entries for older versions of the same file
+    for stale in glob.glob(os.path.join(cache_dir, f"{base}-*.{fmt}")):
+        if stale != cache_file:
+            os.remove(stale)
+    print(f"✓ Cached {os.path.basename(path)} as {fmt}")
+    return df
+
+
+def parse_dates(values, date_format=None):
+    """Parse a date column with an explicit format, inferring it if that fails."""
+    parsed = pd.to_datetime(values, format=date_format, errors="coerce")
+    if date_format and parsed.isna().all() and values.notna().any():
+        print(f"⚠ No dates matched format {date_format!r}; inferring instead")
+        parsed = pd.to_datetime(values, errors="coerce")
+    return parsed
+
+
+def resolve_schema(path, schema, date_index_col):
+    """Match a schema against a CSV header.
+    
+    Returns (usecols, text_dtypes, numeric_dtypes, date_col).
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    date_col = schema.get("date_col")
+    if date_col not in header:
+        date_col = header[date_index_col]
+    
+    wanted = set(schema.get("usecols", header))
+    usecols = [c for c in header if c in wanted or c == date_col]
+    dtypes = {c: t for c, t in schema.get("dtype", {}).items() if c in usecols}
+    text_dtypes = {c: t for c, t in dtypes.items() if t in ("category", "string", "str")}
+    numeric_dtypes = {c: t for c, t in dtypes.items() if c not in text_dtypes}
+    return usecols, text_dtypes, numeric_dtypes, date_col
+
+
+def apply_schema(df, numeric_dtypes, date_col, date_format=None):
+    """Coerce numeric columns and move the parsed date column to the index."""
+    for col, dtype in numeric_dtypes.items():
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    df[date_col] = parse_dates(df[date_col], date_format)
+    return df.set_index(date_col)
+
+
+def read_csv_with_schema(path, schema, date_index_col):
+    """Read only the columns a schema declares, with compact dtypes.
+    
+    Text columns listed as category/string are typed by the CSV parser;
+    numeric ones are coerced afterwards so stray tokens become NaN. The
+    date column becomes the index, as with the legacy positional read.
+    """
+    usecols, text_dtypes, numeric_dtypes, date_col = resolve_schema(path, schema, date_index_col)
+    df = pd.read_csv(path, usecols=usecols, dtype=text_dtypes)
+    return apply_schema(df, numeric_dtypes, date_col, schema.get("date_format"))
+
+
+def stream_counts(config, key):
+    """Aggregate a health feed to (Date, borough) counts, one chunk at a time.
+    
+    Each chunk goes through the same cleaning as prepare_health_data and is
+    folded into a running sum, so memory is bounded by the size of the
+    aggregate rather than the raw file. The result can be passed to
+    prepare_health_data in place of the raw frame.
+    """
+    from preprocessing import aggregate_counts
+    
+    path = os.path.join(config["data"]["local_path"], config["data"]["files"][key])
+    chunksize = config["data"]["streaming"].get("chunksize", 500000)
+    schema = config["data"].get("schema", {}).get(key) or {}
+    usecols, text_dtypes, numeric_dtypes, date_col = resolve_schema(
+        path, schema, DATE_INDEX_COLS[key]
+    )
+    
+    running = None
+    n_rows = 0
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=text_dtypes, chunksize=chunksize):
+        n_rows += len(chunk)
+        chunk = apply_schema(chunk, numeric_dtypes, date_col, schema.get("date_format"))
+        partial = aggregate_counts(chunk).set_index(['Date', 'borough'])['Count']
+        running = partial if running is None else running.add(partial, fill_value=0)
+    
+    if running is None:
+        return pd.DataFrame(columns=['Date', 'borough', 'Count'])
+    print(f"✓ Streamed {key}: {n_rows} rows -> {len(running)} (Date, borough) sums")
+    return running.reset_index()
+
+
+def read_dataset(config, key):
+    """Read one raw dataset, with its date column parsed as the index."""
+    local_path = config["data"]["local_path"]
+    filename = config["data"]["files"][key]
+    path = os.path.join(local_path, filename)
+    cache_config = config["data"].get("cache")
+    
+    schema = config["data"].get("schema", {}).get(key)
+    if schema:
+        read_kwargs = {"schema": schema, "date_index_col": DATE_INDEX_COLS[key]}
+        return read_csv_cached(path, read_kwargs, cache_config, reader=read_csv_with_schema)
+    
+    read_kwargs = {"index_col": DATE_INDEX_COLS[key], "parse_dates": True}
+    return read_csv_cached(path, read_kwargs, cache_config)
+
+
+def memory_report(frames):
+    """Print in-memory size of each loaded DataFrame."""
+    total = 0
+    for name, df in frames.items():
+        size = df.memory_usage(deep=True).sum()
+        total += size
+        print(f"  {name}: {size / 1e6:.1f} MB")
+    print(f"  Total: {total / 1e6:.1f} MB")
+    return total
+
+
+def partition_path(root, key, year, borough):
+    """Directory of one (year, borough) partition of a dataset."""
+    return os.path.join(root, key, f"year={year}", f"borough={quote(borough, safe='')}")
+
+
+def build_partitions(config, key):
+    """Write a dataset as year/borough-partitioned Parquet files.
+    
+    Layout: <dir>/<dataset>/year=YYYY/borough=<name>/part.parquet. Partitions
+    are rebuilt only when the source CSV (size/mtime) or its schema changed,
+    so the check itself never reads the CSV.
+    """
+    from preprocessing import normalize_borough
+    
+    if pa is None:
+        raise ImportError("pyarrow is required for the partitioned dataset layout")
+    
+    root = config["data"]["partitioned"].get("dir", "data/partitioned")
+    path = os.path.join(config["data"]["local_path"], config["data"]["files"][key])
+    stat = os.stat(path)
+    stamp = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "schema": config["data"].get("schema", {}).get(key),
+    }
+    
+    dataset_dir = os.path.join(root, key)
+    stamp_path = os.path.join(dataset_dir, "_source.json")
+    if os.path.exists(stamp_path):
+        with open(stamp_path, "r") as f:
+            if json.load(f) == stamp:
+                return False
+    
+    df = read_dataset(config, key)
+    years = pd.to_datetime(df.index, errors="coerce").year
+    boroughs = normalize_borough(df[BOROUGH_COLS[key]])
+    
+    # Build next to the live copy and swap, so a failed build leaves it intact
+    tmp_root = f"{root}.tmp"
+    shutil.rmtree(os.path.join(tmp_root, key), ignore_errors=True)
+    for (year, borough), part in df.groupby([years, boroughs.values], sort=False):
+        part_dir = partition_path(tmp_root, key, int(year), borough)
+        os.makedirs(part_dir, exist_ok=True)
+        part.to_parquet(os.path.join(part_dir, "part.parquet"))
+    
+    os.makedirs(os.path.join(tmp_root, key), exist_ok=True)
+    with open(os.path.join(tmp_root, key, "_source.json"), "w") as f:
+        json.dump(stamp, f, indent=2)
+    
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.makedirs(root, exist_ok=True)
+    os.replace(os.path.join(tmp_root, key), dataset_dir)
+    try:
+        os.rmdir(tmp_root)
+    except OSError:  # Another dataset is still being built
+        pass
+    print(f"✓ Partitioned {key} into {dataset_dir}")
+    return True
+
+
+def read_partitioned(config, key, years, boroughs):
+    """Read only the (year, borough) partitions of a dataset that are needed."""
+    root = config["data"]["partitioned"].get("dir", "data/partitioned")
+    parts = [
+        os.path.join(partition_path(root, key, year, borough), "part.parquet")
+        for year in sorted(years) for borough in boroughs
+    ]
+    parts = [p for p in parts if os.path.exists(p)]
+    
+    if not parts:
+        # Keep the column layout even when nothing matches
+        any_parts = glob.glob(os.path.join(root, key, "year=*", "borough=*", "part.parquet"))
+        if not any_parts:
+            raise FileNotFoundError(
+                f"Partitioned dataset '{key}' under {os.path.join(root, key)} has no partitions "
+                f"(is the source CSV empty?)"
+            )
+        return pd.read_parquet(any_parts[0]).iloc[0:0]
+    
+    return pd.concat([pd.read_parquet(p) for p in parts])
+
+
+def partition_filter(config):
+    """Years and boroughs the current split/preprocessing config needs."""
+    split = config["split"]
+    years = set(split["train_years"]) | {split["val_year"], split["test_year"]}
+    boroughs = config["preprocessing"]["valid_boroughs"]
+    return years, boroughs
+
+
+def load_partition(config, key, years, boroughs):
+    """Build (if stale) and read the needed partitions of one dataset."""
+    build_partitions(config, key)
+    return read_partitioned(config, key, years, boroughs)
+
+
+def load_data(config, sync=True):
+    """Load all datasets from cloud storage.
+    
+    The four reads are independent and run on the executor configured
+    under execution (serial, thread or process).
+    """
+    from parallel import run_branches
+     
+    print("LOADING DATA FROM CLOUD")
+    
+    # Download new or changed files
+    if sync:
+        sync_data(config)
     
     # Load into DataFrames
     print("\nLoading DataFrames...")
     
-    df_weather = pd.read_csv(
-        f"{local_path}/{files['weather']}", 
-        index_col=1, 
-        parse_dates=True
-    )
-    df_respiratory = pd.read_csv(
-        f"{local_path}/{files['respiratory']}", 
-        index_col=6, 
-        parse_dates=True
-    )
-    df_asthma = pd.read_csv(
-        f"{local_path}/{files['asthma']}", 
-        index_col=6, 
-        parse_dates=True
-    )
-    df_air_quality = pd.read_csv(
-        f"{local_path}/{files['air_quality']}", 
-        index_col=6, 
-        parse_dates=True
-    )
+    keys = ("weather", "respiratory", "asthma", "air_quality")
+    if config["data"].get("partitioned", {}).get("enabled", False):
+        years, boroughs = partition_filter(config)
+        print(f"Reading partitions for years {sorted(years)}")
+        tasks = {key: (load_partition, (config, key, years, boroughs)) for key in keys}
+    else:
+        streaming = config["data"].get("streaming", {}).get("enabled", False)
+        read_health = stream_counts if streaming else read_dataset
+        tasks = {
+            "weather": (read_dataset, (config, "weather")),
+            "respiratory": (read_health, (config, "respiratory")),
+            "asthma": (read_health, (config, "asthma")),
+            "air_quality": (read_dataset, (config, "air_quality")),
+        }
+    
+    frames = run_branches(tasks, config, label="Data loading")
+    df_weather, df_respiratory, df_asthma, df_air_quality = (frames[key] for key in keys)
     
     print(f" Weather data: {df_weather.shape}")
     print(f" Respiratory data: {df_respiratory.shape}")
     print(f" Asthma data: {df_asthma.shape}")
     print(f" Air quality data: {df_air_quality.shape}")
     
+    print("\nMemory usage:")
+    memory_report({
+        "weather": df_weather, "respiratory": df_respiratory,
+        "asthma": df_asthma, "air_quality": df_air_quality
+    })
+    
     return df_weather, df_respiratory, df_asthma, df_air_quality
 
 
@@ -0,0 +1,92 @@
+"""
+Model Engines - Estimators selectable by model_type in config.yaml
+"""
+from sklearn.ensemble import (
+    GradientBoostingClassifier, GradientBoostingRegressor,
+    HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+    RandomForestClassifier, RandomForestRegressor
+)
+from sklearn.linear_model import LogisticRegression, Ridge
+
+# tree: splits on raw values, so inputs need no scaling
+# native_categorical: accepts integer-coded columns via categorical_features
+# native_missing: learns where NaN goes, so missing values need not be filled
+# aliases: shared param names translated for this estimator
+# iterations: param counting boosting rounds (enables early stopping)
+# warm_start: param grown to add stages (rounds/trees) on new data, and the
+#   fitted attribute counting them (None: the param itself)
+ENGINES = {
+    "GradientBoostingClassifier": {
+        "estimator": GradientBoostingClassifier, "tree": True, "iterations": "n_estimators",
+        "warm_start": ("n_estimators", "n_estimators_")
+    },
+    "GradientBoostingRegressor": {
+        "estimator": GradientBoostingRegressor, "tree": True, "iterations": "n_estimators",
+        "warm_start": ("n_estimators", "n_estimators_")
+    },
+    "HistGradientBoostingClassifier": {
+        "estimator": HistGradientBoostingClassifier, "tree": True,
+        "native_categorical": True, "native_missing": True,
+        "aliases": {"n_estimators": "max_iter"}, "iterations": "max_iter",
+        "warm_start": ("max_iter", "n_iter_")
+    },
+    "HistGradientBoostingRegressor": {
+        "estimator": HistGradientBoostingRegressor, "tree": True,
+        "native_categorical": True, "native_missing": True,
+        "aliases": {"n_estimators": "max_iter"}, "iterations": "max_iter",
+        "warm_start": ("max_iter", "n_iter_")
+    },
+    "RandomForestClassifier": {
+        "estimator": RandomForestClassifier, "tree": True, "warm_start": ("n_estimators", None)
+    },
+    "RandomForestRegressor": {
+        "estimator": RandomForestRegressor, "tree": True, "warm_start": ("n_estimators", None)
+    },
+    "LogisticRegression": {"estimator": LogisticRegression, "tree": False},
+    "Ridge": {"estimator": Ridge, "tree": False},
+}
+
+
+def get_engine(model_type):
+    """Registry entry for a model_type."""
+    if model_type not in ENGINES:
+        raise ValueError(f"Unknown model_type: {model_type} (available: {', '.join(ENGINES)})")
+    return ENGINES[model_type]
+
+
+def is_tree_model(model_type):
+    """Whether a model_type is a tree ensemble (unknown types count as not)."""
+    return ENGINES.get(model_type, {}).get("tree", False)
+
+
+def handles_missing(model_type):
+    """Whether a model_type accepts NaN inputs natively."""
+    return ENGINES.get(model_type, {}).get("native_missing", False)
+
+
+def fitted_stages(model, model_type):
+    """Stages (boosting rounds / trees) in a fitted warm-startable model."""
+    param, attribute = get_engine(model_type)["warm_start"]
+    return int(getattr(model, attribute) if attribute else model.get_params()[param])
+
+
+def make_model(task_config, categorical_features=None):
+    """Build the estimator for a classification/regression config section.
+
+    Shared param names are translated (e.g. n_estimators -> max_iter for
+    histogram boosting), params the estimator does not take (e.g. max_depth
+    for Ridge) are dropped with a warning, and integer-coded columns are
+    declared categorical for engines that support it.
+    """
+    engine = get_engine(task_config["model_type"])
+    aliases = engine.get("aliases", {})
+    params = {aliases.get(k, k): v for k, v in (task_config.get("params") or {}).items()}
+    accepted = engine["estimator"]().get_params()
+    ignored = sorted(k for k in params if k not in accepted)
+    if ignored:
+        print(f"⚠ {task_config['model_type']} does not take {', '.join(ignored)}; ignored")
+        params = {k: v for k, v in params.items() if k in accepted}
+
+    if engine.get("native_categorical") and categorical_features:
+        params.setdefault("categorical_features", list(categorical_features))
+    return engine["estimator"](**params)
@@ -3,6 +3,102 @@ Feature Engineering - Create features for modeling
 """
 import pandas as pd
 import numpy as np
+from panel import build_panel, lag_block, prefix_sums, window_block
+from preprocessing import borough_dtype
+
+SEASONS = {
+    12:1, 1:1, 2:1,   # Winter
+    3:2, 4:2, 5:2,    # Spring
+    6:3, 7:3, 8:3,    # Summer
+    9:4, 10:4, 11:4   # Fall
+}
+
+
+def date_features(date):
+    """Temporal features for a single date (same as create_features)."""
+    ts = pd.Timestamp(date)
+    return {
+        'month': ts.month,
+        'day': ts.day,
+        'day_of_week': ts.dayofweek,
+        'quarter': ts.quarter,
+        'is_weekend': int(ts.dayofweek >= 5),
+        'season': SEASONS[ts.month],
+    }
+
+
+def feature_grid(config):
+    """Lag/window feature grid from config.features.
+    
+    Uses features.grid when present; otherwise builds the equivalent grid
+    from the older lag_days / rolling_window / rolling_shift keys.
+    """
+    features = config["features"]
+    if features.get("grid"):
+        return features["grid"]
+    return [
+        {'columns': ['Total_Hospitalization', 'Temp_Max_C', 'Humidity_Avg'],
+         'lags': features["lag_days"]},
+        {'columns': ['Total_Hospitalization', 'Temp_Max_C'],
+         'windows': [features["rolling_window"]], 'aggs': ['mean'],
+         'shift': features["rolling_shift"]},
+    ]
+
+
+def grid_feature_names(grid, available=None):
+    """Feature specs for a grid as (name, column, kind, params) tuples.
+    
+    Lags are named {col}_lag{n}; window means keep the {col}_roll{w} name
+    and other aggregations get a suffix, e.g. {col}_roll{w}_max.
+    """
+    specs = []
+    for entry in grid:
+        cols = [c for c in entry['columns'] if available is None or c in available]
+        shift = entry.get('shift', 0)
+        for col in cols:
+            for lag in entry.get('lags', []):
+                specs.append((f'{col}_lag{lag}', col, 'lag', (lag,)))
+        for col in cols:
+            for window in entry.get('windows', []):
+                for agg in entry.get('aggs', ['mean']):
+                    suffix = '' if agg == 'mean' else f'_{agg}'
+                    specs.append((f'{col}_roll{window}{suffix}', col, 'window', (window, shift, agg)))
+    
+    names = [name for name, *_ in specs]
+    if len(set(names)) < len(names):
+        raise ValueError("Feature grid produces duplicate feature names")
+    return specs
+
+
+def grid_features(df, grid):
+    """Materialize every lag/window feature of a grid in one batched pass.
+    
+    Each distinct lag or (window, shift, agg) is computed once across all
+    panel variables, and results are written into one preallocated matrix.
+    """
+    specs = grid_feature_names(grid, available=df.columns)
+    panel_cols = list(dict.fromkeys(col for _, col, _, _ in specs))
+    if not specs:
+        return pd.DataFrame(index=df.index)
+    
+    panel, geo_idx, day_idx = build_panel(df, panel_cols)
+    sums = prefix_sums(panel) if any(kind == 'window' for _, _, kind, _ in specs) else None
+    
+    # Group output columns by the block (lag or window/shift/agg) they come from
+    by_block = {}
+    for i, (name, col, kind, params) in enumerate(specs):
+        by_block.setdefault((kind, params), []).append((i, panel_cols.index(col)))
+    
+    out = np.empty((len(df), len(specs)))
+    for (kind, params), targets in by_block.items():
+        if kind == 'lag':
+            block = lag_block(panel, geo_idx, day_idx, params)[:, 0]
+        else:
+            window, shift, agg = params
+            block = window_block(panel, geo_idx, day_idx, window, shift, agg, sums=sums)
+        out[:, [i for i, _ in targets]] = block[:, [v for _, v in targets]]
+    
+    return pd.DataFrame(out, columns=[name for name, *_ in specs], index=df.index)
 
 
 def create_features(df, config):
@@ -19,45 +115,30 @@ def create_features(df, config):
     df['day_of_week'] = df['Date'].dt.dayofweek
     df['quarter'] = df['Date'].dt.quarter
     df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
-    df['season'] = df['month'].map({
-        12:1, 1:1, 2:1,   # Winter
-        3:2, 4:2, 5:2,    # Spring
-        6:3, 7:3, 8:3,    # Summer
-        9:4, 10:4, 11:4   # Fall
-    })
+    df['season'] = df['month'].map(SEASONS)
     
     print("✓ Temporal features created")
     
-    # One-hot encode borough
-    if 'borough' in df.columns:
-        df = pd.get_dummies(df, columns=['borough'], prefix='borough')
-        print("✓ Borough one-hot encoded")
-    
-    # Sort for lag features
-    df = df.sort_values('Date').reset_index(drop=True)
-    
-    # Lag features
-    lag_days = config["features"]["lag_days"]
-    lag_cols = ['Total_Hospitalization', 'Temp_Max_C', 'Humidity_Avg']
-    
-    for col in lag_cols:
-        if col in df.columns:
-            for lag in lag_days:
-                df[f'{col}_lag{lag}'] = df[col].shift(lag)
+    # Lag and rolling features are computed per borough over calendar days,
+    # on a dense (borough x day x variable) panel
+    df = df.sort_values(['Date', 'borough']).reset_index(drop=True)
+    grid = feature_grid(config)
+    panel_features = grid_features(df, grid)
+    print(f"✓ Lag/rolling features created ({panel_features.shape[1]} from {len(grid)} grid entries)")
     
-    print(f"✓ Lag features created (lags: {lag_days})")
-    
-    # Rolling averages with shift
-    rolling_window = config["features"]["rolling_window"]
-    rolling_shift = config["features"]["rolling_shift"]
-    
-    for col in ['Total_Hospitalization', 'Temp_Max_C']:
-        if col in df.columns:
-            df[f'{col}_roll{rolling_window}'] = (
-                df[col].rolling(window=rolling_window, min_periods=1).mean().shift(rolling_shift)
-            )
-    
-    print(f"✓ Rolling features created (window: {rolling_window}, shift: {rolling_shift})")
+    # Encode borough: one-hot columns, or a single integer code whose
+    # mapping (sorted valid_boroughs) is saved with the model
+    if 'borough' in df.columns:
+        if config["features"].get("geo_encoding", "onehot") == "code":
+            geo_dtype = borough_dtype(config["preprocessing"]["valid_boroughs"])
+            df['borough_code'] = df['borough'].astype(geo_dtype).cat.codes.astype(np.int16)
+            df = df.drop(columns='borough')
+            print(f"✓ Borough encoded as integer codes ({len(geo_dtype.categories)} categories)")
+        else:
+            df = pd.get_dummies(df, columns=['borough'], prefix='borough')
+            print("✓ Borough one-hot encoded")
+    
+    df = pd.concat([df, panel_features], axis=1)
     
     # Temperature range
     if 'Temp_Max_C' in df.columns and 'Temp_Min_C' in df.columns:
@@ -0,0 +1,182 @@
+"""
+Feature Store - Per-borough ring buffers for serving-time lag/rolling features
+"""
+import numpy as np
+import pandas as pd
+from feature_engineering import grid_feature_names, date_features
+
+NS_PER_DAY = 86_400_000_000_000
+
+
+def to_day(date):
+    """Days since the epoch for a date-like value."""
+    return pd.Timestamp(date).normalize().value // NS_PER_DAY
+
+
+class BoroughBuffer:
+    """The last `capacity` days of observations for one borough.
+    
+    Alongside each day's values it keeps running sums, sums of squares and
+    counts up to and including that day, so any window mean/std inside the
+    buffer is a difference of two slots. Appending a day is O(1).
+    """
+
+    def __init__(self, capacity, n_vars):
+        self.capacity = capacity
+        self.values = np.full((capacity, n_vars), np.nan)
+        self.csum = np.zeros((capacity, n_vars))
+        self.csq = np.zeros((capacity, n_vars))
+        self.ccount = np.zeros((capacity, n_vars))
+        self.first_day = None
+        self.last_day = None
+
+    def _write(self, day, row, prev):
+        """Store a day's values and its running totals on top of `prev`."""
+        slot = day % self.capacity
+        valid = ~np.isnan(row)
+        filled = np.where(valid, row, 0.0)
+        self.values[slot] = row
+        self.csum[slot] = prev[0] + filled
+        self.csq[slot] = prev[1] + filled * filled
+        self.ccount[slot] = prev[2] + valid
+
+    def _totals(self, day):
+        """Running (sum, sumsq, count) through `day`, or None if evicted."""
+        if self.first_day is None or day < self.first_day:
+            zeros = np.zeros(self.values.shape[1])
+            return zeros, zeros, zeros
+        if day > self.last_day:
+            day = self.last_day
+        if day <= self.last_day - self.capacity:
+            return None
+        slot = day % self.capacity
+        return self.csum[slot], self.csq[slot], self.ccount[slot]
+
+    def push(self, day, row):
+        """Append (or replace the latest) day of observations."""
+        row = np.asarray(row, dtype=np.float64)
+        if self.last_day is None:
+            self.first_day = self.last_day = day
+            self._write(day, row, (0.0, 0.0, 0.0))
+            return
+        if day < self.last_day:
+            raise ValueError(f"Day {day} is older than the latest stored day {self.last_day}")
+        if day == self.last_day:
+            # Correction of the latest day: rebuild its slot on the day before
+            prev = self._totals(day - 1) if day > self.first_day else (0.0, 0.0, 0.0)
+            self._write(day, row, prev)
+            return
+        
+        # Days with no observations carry the totals forward (capped at capacity)
+        prev = self._totals(self.last_day)
+        empty = np.full_like(row, np.nan)
+        for gap_day in range(max(self.last_day + 1, day - self.capacity + 1), day):
+            self._write(gap_day, empty, prev)
+        self._write(day, row, prev)
+        self.last_day = day
+
+    def value(self, day):
+        """Observed values for `day` (NaN if unknown or evicted)."""
+        if (self.last_day is None or day < self.first_day or day > self.last_day
+                or day <= self.last_day - self.capacity):
+            return np.full(self.values.shape[1], np.nan)
+        return self.values[day % self.capacity]
+
+    def window(self, start, end, agg):
+        """Aggregate over days [start, end] (NaN where nothing is observed)."""
+        n_vars = self.values.shape[1]
+        if agg in ('mean', 'std'):
+            hi, lo = self._totals(end), self._totals(start - 1)
+            if hi is None or lo is None:
+                return np.full(n_vars, np.nan)
+            total, sq, count = (np.asarray(h - l, dtype=np.float64) for h, l in zip(hi, lo))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if agg == 'mean':
+                    return np.where(count >= 1, total / count, np.nan)
+                var = np.maximum(sq - total * total / count, 0) / (count - 1)
+                return np.where(count >= 2, np.sqrt(var), np.nan)
+        
+        if self.last_day is None:
+            return np.full(n_vars, np.nan)
+        start = max(start, self.first_day, self.last_day - self.capacity + 1)
+        end = min(end, self.last_day)
+        if start > end:
+            return np.full(n_vars, np.nan)
+        reducer = np.fmax if agg == 'max' else np.fmin
+        slots = np.arange(start, end + 1) % self.capacity
+        return reducer.reduce(self.values[slots], axis=0)
+
+
+class FeatureStore:
+    """Recent daily observations per borough, for building serving features.
+    
+    Holds enough history for every lag/window in the feature grid (plus a
+    forecast horizon), so ModelService can turn just (date, borough) into a
+    complete feature vector instead of zero-filling missing lags.
+    """
+
+    def __init__(self, grid, columns=None, horizon=7):
+        self.specs = grid_feature_names(grid)
+        grid_cols = [col for _, col, _, _ in self.specs]
+        self.columns = list(dict.fromkeys(grid_cols + list(columns or [])))
+        
+        depth = [params[0] for _, _, kind, params in self.specs if kind == 'lag']
+        depth += [params[0] + params[1] for _, _, kind, params in self.specs if kind == 'window']
+        self.capacity = max(depth, default=0) + horizon + 1
+        self.index = {col: i for i, col in enumerate(self.columns)}
+        self.buffers = {}
+
+    @classmethod
+    def from_frame(cls, df, grid, horizon=7):
+        """Build a store from the processed (Date, borough, ...) frame."""
+        numeric = df.select_dtypes(include=[np.number]).columns
+        columns = [c for c in numeric if c != 'year']
+        store = cls(grid, columns=columns, horizon=horizon)
+        
+        recent = df.sort_values(['borough', 'Date']).groupby('borough', observed=True).tail(store.capacity)
+        for row in recent.to_dict('records'):
+            store.update(row['Date'], row['borough'], row)
+        return store
+
+    def update(self, date, borough, observations):
+        """Record one day of observations (a dict of column -> value)."""
+        borough = str(borough).strip().lower()
+        if borough not in self.buffers:
+            self.buffers[borough] = BoroughBuffer(self.capacity, len(self.columns))
+        row = [observations.get(col, np.nan) for col in self.columns]
+        self.buffers[borough].push(to_day(date), pd.to_numeric(row, errors='coerce'))
+
+    def latest_date(self, borough=None):
+        """Most recent stored date (for one borough, or across all)."""
+        buffers = [self.buffers[borough]] if borough else self.buffers.values()
+        days = [b.last_day for b in buffers if b.last_day is not None]
+        return pd.Timestamp(max(days) * NS_PER_DAY) if days else None
+
+    def features(self, date, borough):
+        """Temporal, observed, lag and rolling features for (date, borough)."""
+        features = date_features(date)
+        buffer = self.buffers.get(str(borough).strip().lower())
+        if buffer is None:
+            return features
+        
+        day = to_day(date)
+        observed = buffer.value(day)
+        features.update({
+            col: float(v) for col, v in zip(self.columns, observed) if not np.isnan(v)
+        })
+        
+        # Each lag/window is computed once for all columns and then indexed
+        blocks = {}
+        for name, col, kind, params in self.specs:
+            if (kind, params) not in blocks:
+                if kind == 'lag':
+                    blocks[kind, params] = buffer.value(day - params[0])
+                else:
+                    window, shift, agg = params
+                    end = day - shift
+                    blocks[kind, params] = buffer.window(end - window + 1, end, agg)
+            features[name] = float(blocks[kind, params][self.index[col]])
+        
+        if 'Temp_Max_C' in features and 'Temp_Min_C' in features:
+            features['Temp_Range'] = features['Temp_Max_C'] - features['Temp_Min_C']
+        return features
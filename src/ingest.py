@@ -0,0 +1,276 @@
+"""
+Ingestion - Fold new daily readings into the processed store as they arrive
+"""
+import os
+import glob
+import time
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+from data_loader import load_config, load_data, read_csv_with_schema, DATE_INDEX_COLS
+from preprocessing import (
+    prepare_weather_data, aggregate_counts, prepare_air_quality_data,
+    preprocess_data, borough_dtype
+)
+from feature_engineering import feature_grid
+from feature_store import FeatureStore
+
+# Health count columns are only ever observed, never imputed
+HEALTH_COLS = {"respiratory": "Respiratory_Count", "asthma": "Asthma_Count"}
+TOTAL_COL = "Total_Hospitalization"
+
+
+def dataset_for(filename, config):
+    """Dataset key a dropped file belongs to, from its filename prefix."""
+    name = filename.lower()
+    keys = sorted(config["data"]["files"], key=len, reverse=True)
+    return next((key for key in keys if name.startswith(key)), None)
+
+
+def read_drop(path, config, key):
+    """Read a dropped CSV with the same schema as the full dataset."""
+    schema = config["data"].get("schema", {}).get(key)
+    if schema:
+        return read_csv_with_schema(path, schema, DATE_INDEX_COLS[key])
+    return pd.read_csv(path, index_col=DATE_INDEX_COLS[key], parse_dates=True)
+
+
+def clean_rows(df, key, config):
+    """Run new raw rows through the same cleaning rules as preprocessing.py.
+    
+    Health feeds are aggregated without the split-year filter, since new
+    readings are by definition outside the years the model was trained on.
+    """
+    if key == "weather":
+        rows = prepare_weather_data(df)
+    elif key in HEALTH_COLS:
+        rows = aggregate_counts(df).rename(columns={'Count': HEALTH_COLS[key]})
+    else:
+        rows = prepare_air_quality_data(df, config)
+    
+    rows = rows[rows['borough'].isin(config["preprocessing"]["valid_boroughs"])]
+    return rows.reset_index(drop=True)
+
+
+def upsert(processed, rows, config):
+    """Overwrite or append rows by (Date, borough).
+    
+    Returns the updated frame (sorted by borough and Date, as after
+    impute_missing) and the index of the (Date, borough) keys touched.
+    """
+    keys = ['Date', 'borough']
+    base = processed.assign(borough=processed['borough'].astype(str)).set_index(keys)
+    new = rows.assign(borough=rows['borough'].astype(str)).set_index(keys)
+    new = new.groupby(level=keys).last()
+    
+    base = base.reindex(base.index.union(new.index))
+    for col in new.columns:
+        if col not in base.columns:
+            base[col] = np.nan
+        values = new[col].to_numpy()
+        if pd.isna(values).any() and not np.issubdtype(base[col].dtype, np.floating):
+            base[col] = base[col].astype(np.float64)  # Integer columns cannot hold NaN
+        base.loc[new.index, col] = values.astype(base[col].dtype)
+    
+    base = base.reset_index()
+    base['borough'] = base['borough'].astype(borough_dtype(config["preprocessing"]["valid_boroughs"]))
+    base = base.sort_values(['borough', 'Date']).reset_index(drop=True)
+    return base, new.index
+
+
+def fill_new_rows(df, touched):
+    """Derive totals and impute environmental gaps on the touched rows only.
+    
+    Totals follow prepare_health_data (a missing feed counts as 0 once the
+    other has arrived). Other numeric columns are carried forward within the
+    borough from the row before each touched one (older rows are already
+    filled), then fall back to the column mean, as in impute_missing; there
+    is no backward fill because later days have not arrived yet.
+    """
+    keys = pd.MultiIndex.from_arrays([df['Date'], df['borough'].astype(str)])
+    rows = np.flatnonzero(keys.isin(touched))
+    idx = df.index[rows]
+    
+    health = [col for col in HEALTH_COLS.values() if col in df.columns]
+    counts = df.loc[idx, health]
+    observed = counts.notna().any(axis=1)
+    counts.loc[observed] = counts.loc[observed].fillna(0)
+    df.loc[idx, health] = counts
+    df.loc[idx, TOTAL_COL] = counts.sum(axis=1, min_count=1).astype(df[health[0]].dtype)
+    years = df.loc[idx, 'Date'].dt.year
+    df.loc[idx, 'year'] = years
+    if df['year'].dtype != years.dtype:  # New keys were added as NaN rows
+        df['year'] = df['year'].astype(years.dtype)
+    
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    env_cols = [c for c in numeric_cols if c not in health + [TOTAL_COL, 'year']]
+    gap_cols = [c for c in env_cols if df.loc[idx, c].isna().any()]
+    if gap_cols:
+        # Each touched row plus the row before it in the same borough
+        codes = df['borough'].cat.codes.to_numpy()
+        prev = rows[rows > 0] - 1
+        prev = prev[codes[prev] == codes[prev + 1]]
+        window = df.iloc[np.union1d(rows, prev)]
+        filled = window[gap_cols].groupby(window['borough'], sort=False, observed=True).ffill()
+        filled = filled.fillna(df[gap_cols].mean())
+        df.loc[idx, gap_cols] = filled.loc[idx]
+    return df
+
+
+def write_atomic(path, write):
+    """Write a file through a temporary path so readers never see a partial one."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_processed(path):
+    """Read the processed store (one Parquet file per year), sorted by borough and Date."""
+    parts = sorted(glob.glob(os.path.join(path, "*.parquet")))
+    df = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+    return df.sort_values(['borough', 'Date'], kind='stable').reset_index(drop=True)
+
+
+def write_processed(path, df, years=None):
+    """Write the year files of the processed store; only `years` if given.
+    
+    A batch of new or corrected days rewrites the files of the years it
+    touches (a few thousand rows each), never the whole history.
+    """
+    os.makedirs(path, exist_ok=True)
+    for year in sorted(df['year'].unique() if years is None else years):
+        part = df[df['year'] == year].reset_index(drop=True)
+        write_atomic(os.path.join(path, f"{year}.parquet"), part.to_parquet)
+
+
+def save_feature_store(store, path):
+    """Pickle the feature store for ModelService to pick up."""
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(store, f)
+    write_atomic(path, write)
+
+
+def load_processed(config):
+    """Load the processed store, building it with a full preprocess if absent."""
+    path = config["ingest"]["processed_path"]
+    if glob.glob(os.path.join(path, "*.parquet")):
+        df = read_processed(path)
+        print(f"✓ Processed store loaded: {path} ({len(df)} rows)")
+        return df
+    
+    print(f"⚠ No processed store at {path}; building it from the raw data")
+    df_weather, df_resp, df_asthma, df_airq = load_data(config)
+    df = preprocess_data(df_weather, df_resp, df_asthma, df_airq, config)
+    write_processed(path, df)
+    return df
+
+
+def load_feature_store(config, processed):
+    """Load the serving feature store, or build it from the processed store."""
+    path = config["ingest"]["feature_store_path"]
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    
+    store = FeatureStore.from_frame(
+        processed, feature_grid(config), horizon=config["features"].get("store_horizon", 7)
+    )
+    save_feature_store(store, path)
+    return store
+
+
+def update_feature_store(store, processed, touched, config):
+    """Push touched rows into the feature store, oldest first.
+    
+    A correction to a day older than a borough's latest one cannot be
+    appended to its ring buffer, so the store is rebuilt from the tail of
+    the processed store instead (a few hundred rows).
+    """
+    rows = processed.assign(_b=processed['borough'].astype(str)).set_index(['Date', '_b'])
+    rows = rows.loc[rows.index.intersection(touched)].reset_index().sort_values('Date')
+    try:
+        for row in rows.to_dict('records'):
+            store.update(row['Date'], row['borough'], row)
+        return store
+    except ValueError:
+        return FeatureStore.from_frame(
+            processed, feature_grid(config), horizon=config["features"].get("store_horizon", 7)
+        )
+
+
+def ingest_files(paths, processed, store, config):
+    """Clean, upsert and publish a batch of dropped files."""
+    drop_dir = config["ingest"]["drop_dir"]
+    batches, done, failed = [], [], []
+    
+    for path in paths:
+        key = dataset_for(os.path.basename(path), config)
+        try:
+            if key is None:
+                raise ValueError(f"no dataset matches {os.path.basename(path)}")
+            batches.append(clean_rows(read_drop(path, config, key), key, config))
+            done.append(path)
+        except Exception as e:
+            print(f"⚠ Could not ingest {os.path.basename(path)}: {e}")
+            failed.append(path)
+    
+    columns = processed.columns
+    touched = pd.MultiIndex.from_tuples([], names=['Date', 'borough'])
+    for rows in batches:
+        if len(rows):
+            processed, keys = upsert(processed, rows, config)
+            touched = touched.union(keys)
+    
+    if len(touched):
+        if processed.columns.isin(columns).all():
+            processed = fill_new_rows(processed, touched)
+            years = set(touched.get_level_values('Date').year)
+        else:  # A new column is missing on every older row: fill and write all of them
+            everything = pd.MultiIndex.from_arrays([processed['Date'], processed['borough'].astype(str)])
+            processed = fill_new_rows(processed, everything)
+            years = None
+        write_processed(config["ingest"]["processed_path"], processed, years)
+        store = update_feature_store(store, processed, touched, config)
+        save_feature_store(store, config["ingest"]["feature_store_path"])
+    
+    for paths_out, folder in ((done, "done"), (failed, "failed")):
+        for path in paths_out:
+            shutil.move(path, os.path.join(drop_dir, folder, os.path.basename(path)))
+    
+    return processed, store, len(touched)
+
+
+def run_ingest(config_path=None, once=False):
+    """Watch the drop directory and ingest new CSVs as they appear.
+    
+    The drop directory stands in for a queue: producers write each file
+    under a temporary name and rename it to *.csv when complete. Files are
+    matched to datasets by filename prefix (weather_*.csv, asthma_*.csv, ...)
+    and moved to done/ or failed/ once handled.
+    """
+    config = load_config(config_path)
+    ingest_config = config["ingest"]
+    drop_dir = ingest_config["drop_dir"]
+    for folder in ("done", "failed"):
+        os.makedirs(os.path.join(drop_dir, folder), exist_ok=True)
+    
+    processed = load_processed(config)
+    store = load_feature_store(config, processed)
+    print(f"✓ Watching {drop_dir} (every {ingest_config.get('poll_seconds', 2)}s)")
+    
+    while True:
+        paths = sorted(
+            os.path.join(drop_dir, name) for name in os.listdir(drop_dir)
+            if name.lower().endswith('.csv')
+        )
+        if paths:
+            start = time.perf_counter()
+            processed, store, n_rows = ingest_files(paths, processed, store, config)
+            print(f"✓ Ingested {len(paths)} file(s), {n_rows} (Date, borough) rows "
+                  f"in {time.perf_counter() - start:.2f}s")
+        if once:
+            return processed, store
+        time.sleep(ingest_config.get("poll_seconds", 2))
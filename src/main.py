@@ -3,10 +3,19 @@ Main Pipeline - Run full training pipeline
 """
 import yaml
 import os
-from data_loader import load_config, load_data
+import data_loader
+import preprocessing
+import feature_engineering
+import train
+from data_loader import load_config, load_data, sync_data, data_fingerprint
 from preprocessing import preprocess_data
 from feature_engineering import create_features, create_target
-from train import prepare_splits, run_mlflow_experiment
+from train import (
+    prepare_splits, run_mlflow_experiment, needs_scaling, keeps_missing,
+    detach_matrix, attach_matrix
+)
+from stage_cache import StageCache, source_digest
+from feature_store import FeatureStore
 
 
 def run_pipeline(config_path=None):
@@ -23,21 +32,12 @@ def run_pipeline(config_path=None):
     config = load_config(config_path)
     print(f" Config loaded from {config_path}")
     
-    # Step 1: Load data
-    df_weather, df_resp, df_asthma, df_airq = load_data(config)
-    
-    # Step 2: Preprocess
-    df_processed = preprocess_data(df_weather, df_resp, df_asthma, df_airq, config)
-    
-    # Step 3: Feature engineering
-    df_featured = create_features(df_processed, config)
-    df_final = create_target(df_featured, config)
-    
-    # Step 4: Prepare splits
-    splits = prepare_splits(df_final, config)
+    splits, feature_store = prepare_training_data(config)
     
     # Step 5: Train with MLFlow tracking
-    classifier, regressor, class_metrics, reg_metrics = run_mlflow_experiment(splits, config)
+    classifier, regressor, class_metrics, reg_metrics = run_mlflow_experiment(
+        splits, config, feature_store=feature_store
+    )
     
 
     print(" PIPELINE COMPLETE!")
@@ -51,5 +51,90 @@ def run_pipeline(config_path=None):
     }
 
 
+def stage_loaders(config):
+    """Sync the data; return the stage cache, stage keys and lazy frame loaders.
+    
+    processed() and features() resume from the first stage whose inputs
+    changed and remember their frame, so each is built at most once.
+    """
+    
+    # Stage keys: each chains its parent's key with the config it reads
+    cache = StageCache(config.get("stage_cache"))
+    sync_data(config)
+    data_key = cache.key("data", None, config, [], code=data_fingerprint(config))
+    preprocess_key = cache.key(
+        "preprocess", data_key, config, ["data", "preprocessing", "split"],
+        code=source_digest(data_loader, preprocessing)
+    )
+    features_key = cache.key(
+        "features", preprocess_key, config, ["features", "target"],
+        code=source_digest(feature_engineering)
+    )
+    splits_key = cache.key(
+        "splits", features_key, config, ["split"],
+        code=source_digest(train) + f"scaled={needs_scaling(config)},nan={keeps_missing(config)}"
+    )
+    keys = {"preprocess": preprocess_key, "features": features_key, "splits": splits_key}
+    frames = {}
+    
+    def processed():
+        if frames.get("preprocess") is None:
+            frames["preprocess"] = cache.load("preprocess", preprocess_key)
+        if frames["preprocess"] is None:
+            # Step 1: Load data
+            df_weather, df_resp, df_asthma, df_airq = load_data(config, sync=False)
+            
+            # Step 2: Preprocess
+            frames["preprocess"] = preprocess_data(df_weather, df_resp, df_asthma, df_airq, config)
+            cache.save("preprocess", preprocess_key, frames["preprocess"])
+        return frames["preprocess"]
+    
+    def features():
+        if frames.get("features") is None:
+            frames["features"] = cache.load("features", features_key)
+        if frames["features"] is None:
+            # Step 3: Feature engineering
+            df_featured = create_features(processed(), config)
+            frames["features"] = create_target(df_featured, config)
+            cache.save("features", features_key, frames["features"])
+        return frames["features"]
+    
+    return cache, keys, processed, features
+
+
+def prepare_training_data(config):
+    """Sync the data and return (splits, feature_store), through the stage cache."""
+    cache, keys, processed, features = stage_loaders(config)
+    
+    splits = attach_matrix(cache.load("splits", keys["splits"]))
+    if splits is None:
+        # Step 4: Prepare splits
+        splits = prepare_splits(features(), config, name=keys["splits"][:16])
+        memmap_dir = config["split"].get("memmap_dir")
+        for name in cache.save("splits", keys["splits"], detach_matrix(splits)):
+            if memmap_dir and os.path.exists(os.path.join(memmap_dir, f"{name}.npy")):
+                os.remove(os.path.join(memmap_dir, f"{name}.npy"))  # Matrix of an evicted entry
+    
+    # Recent per-borough history for serving-time lag/rolling features
+    feature_store = cache.load("feature_store", keys["features"])
+    if feature_store is None:
+        feature_store = FeatureStore.from_frame(
+            processed(), feature_engineering.feature_grid(config),
+            horizon=config["features"].get("store_horizon", 7)
+        )
+        cache.save("feature_store", keys["features"], feature_store)
+    
+    cache.summary()
+    return splits, feature_store
+
+
+def prepare_feature_frame(config):
+    """Sync the data and return the feature/target frame, through the stage cache."""
+    cache, _, _, features = stage_loaders(config)
+    df_final = features()
+    cache.summary()
+    return df_final
+
+
 if __name__ == "__main__":
     results = run_pipeline()
@@ -0,0 +1,118 @@
+"""
+Panel - Dense (geo x day x variable) arrays for lag and rolling features
+"""
+import numpy as np
+import pandas as pd
+
+
+def build_panel(df, columns, geo_col='borough', date_col='Date'):
+    """Scatter rows into a dense (geo x day x variable) float array.
+    
+    Days with no row for a geography are NaN, so lags and windows are
+    measured in calendar days within each geography.
+    
+    Returns:
+        panel, plus each row's geo and day index into it
+    """
+    geo_idx, geos = pd.factorize(df[geo_col], sort=True)
+    days = df[date_col].to_numpy().astype('datetime64[D]').astype(np.int64)
+    day_idx = days - days.min() if len(days) else days
+    n_days = int(day_idx.max()) + 1 if len(days) else 0
+    
+    flat = geo_idx.astype(np.int64) * n_days + day_idx
+    if len(np.unique(flat)) < len(flat):
+        raise ValueError(f"Expected one row per ({geo_col}, {date_col})")
+    
+    panel = np.full((len(geos), n_days, len(columns)), np.nan)
+    panel[geo_idx, day_idx] = df[columns].to_numpy(dtype=np.float64)
+    return panel, geo_idx, day_idx
+
+
+def lag_block(panel, geo_idx, day_idx, lags):
+    """Value of every variable `lag` days earlier, per row.
+    
+    Returns an (n_rows, n_lags, n_vars) array; NaN before the panel starts.
+    """
+    out = np.full((len(geo_idx), len(lags), panel.shape[2]), np.nan)
+    for i, lag in enumerate(lags):
+        source = day_idx - lag
+        ok = source >= 0
+        out[ok, i] = panel[geo_idx[ok], source[ok]]
+    return out
+
+
+def prefix_sums(panel):
+    """Cumulative sums, sums of squares and non-NaN counts along the day axis.
+    
+    Each has a leading zero day, so the total over days [a, b] is
+    c[:, b + 1] - c[:, a].
+    """
+    valid = ~np.isnan(panel)
+    values = np.where(valid, panel, 0.0)
+    pad = ((0, 0), (1, 0), (0, 0))
+    return {
+        'sum': np.pad(np.cumsum(values, axis=1), pad),
+        'sumsq': np.pad(np.cumsum(values * values, axis=1), pad),
+        'count': np.pad(np.cumsum(valid, axis=1), pad),
+    }
+
+
+WINDOW_AGGS = ('mean', 'std', 'max', 'min')
+
+
+def rolling_extreme(panel, window, reducer):
+    """Trailing-window max/min along the day axis in log2(window) passes.
+    
+    reducer is np.fmax or np.fmin (both skip NaN). After each doubling step
+    acc[t] covers days [t - span + 1, t]; a final overlapping step widens
+    that to exactly `window` days.
+    """
+    def shifted(a, k):
+        out = np.full_like(a, np.nan)
+        out[:, k:] = a[:, :-k]
+        return out
+    
+    acc, span = panel, 1
+    while span * 2 <= window:
+        acc = reducer(acc, shifted(acc, span))
+        span *= 2
+    if span < window:
+        acc = reducer(acc, shifted(acc, window - span))
+    return acc
+
+
+def window_block(panel, geo_idx, day_idx, window, shift=0, agg='mean',
+                 min_periods=1, sums=None):
+    """Aggregate over the `window` days ending `shift` days before each row.
+    
+    Matches rolling(window, min_periods).<agg>().shift(shift) applied to one
+    geography's daily series. mean/std come from prefix sums; max/min from
+    rolling_extreme. Returns an (n_rows, n_vars) array.
+    """
+    if agg not in WINDOW_AGGS:
+        raise ValueError(f"Unknown window aggregation: {agg}")
+    sums = sums if sums is not None else prefix_sums(panel)
+    
+    end = day_idx - shift
+    start = np.maximum(end - window + 1, 0)
+    ok = end >= 0
+    g, e, s = geo_idx[ok], end[ok], start[ok]
+    
+    count = sums['count'][g, e + 1] - sums['count'][g, s]
+    enough = count >= max(min_periods, 2 if agg == 'std' else 1)
+    
+    if agg in ('mean', 'std'):
+        total = sums['sum'][g, e + 1] - sums['sum'][g, s]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if agg == 'mean':
+                value = total / count
+            else:
+                sq = sums['sumsq'][g, e + 1] - sums['sumsq'][g, s]
+                value = np.sqrt(np.maximum(sq - total * total / count, 0) / (count - 1))
+    else:
+        reducer = np.fmax if agg == 'max' else np.fmin
+        value = rolling_extreme(panel, window, reducer)[g, e]
+    
+    out = np.full((len(geo_idx), panel.shape[2]), np.nan)
+    out[ok] = np.where(enough, value, np.nan)
+    return out
@@ -0,0 +1,51 @@
+"""
+Parallel - Run independent pipeline branches concurrently
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+def timed(fn, *args):
+    """Call fn(*args) and return (result, seconds)."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_branches(tasks, config, label="branches", executor=None):
+    """Run independent tasks and join them, reporting wall-clock per branch.
+    
+    Args:
+        tasks: dict of name -> (fn, args); functions must be module-level
+            when the process executor is used
+        config: pipeline config; execution.executor picks serial, thread
+            or process, execution.max_workers caps the pool size
+        executor: overrides execution.executor for this call
+    
+    Returns:
+        dict of name -> result, in the same order as tasks
+    """
+    execution = config.get("execution", {})
+    kind = executor or execution.get("executor", "serial")
+    max_workers = execution.get("max_workers") or len(tasks)
+    
+    start = time.perf_counter()
+    if kind == "serial" or len(tasks) < 2:
+        outcomes = {name: timed(fn, *args) for name, (fn, args) in tasks.items()}
+    elif kind in EXECUTORS:
+        with EXECUTORS[kind](max_workers=min(max_workers, len(tasks))) as pool:
+            futures = {name: pool.submit(timed, fn, *args) for name, (fn, args) in tasks.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+    else:
+        raise ValueError(f"Unknown executor: {kind}")
+    wall = time.perf_counter() - start
+    
+    print(f"\n{label} ({kind}):")
+    for name, (_, seconds) in outcomes.items():
+        print(f"  {name}: {seconds:.2f}s")
+    total = sum(seconds for _, seconds in outcomes.values())
+    print(f"  wall clock: {wall:.2f}s (sum of branches: {total:.2f}s)")
+    
+    return {name: result for name, (result, _) in outcomes.items()}
@@ -6,21 +6,29 @@ import os
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from artifacts import load_artifact
 
 class ModelService:
     """Service class to load models and make predictions."""
 
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, feature_store_path=None):
         """
         Initialize model service.
         
         Args:
-            model_path: Path to the saved models.pkl file
+            model_path: Artifact root (models/artifacts, published version in
+                CURRENT), a version directory, or a legacy models.pkl
+            feature_store_path: Feature store kept current by `entrypoint.py ingest`
         """
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         if model_path is None:
             # Build absolute path to model if not provided
-            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            model_path = os.path.join(project_root, 'models', 'best_model.pkl')
+            model_path = os.path.join(project_root, 'models', 'artifacts')
+            legacy_path = os.path.join(project_root, 'models', 'models.pkl')
+            if not os.path.exists(model_path) and os.path.exists(legacy_path):
+                model_path = legacy_path
+        if feature_store_path is None:
+            feature_store_path = os.path.join(project_root, 'models', 'feature_store.pkl')
         
         print(f"Looking for model at: {model_path}")
         
@@ -32,52 +40,72 @@ class ModelService:
         
         print(f"✓ Loading model from: {model_path}")
         
-        # Load models (use only ONE method - whichever was used to save)
-        # If saved with joblib, use joblib.load:
-        artifacts = joblib.load(model_path)
-        
-        # OR if saved with pickle, use pickle.load:
-        # with open(model_path, 'rb') as f:
-        #     artifacts = pickle.load(f)
+        # arrays.bin is memory-mapped read-only: HistGradientBoosting predictors and the
+        # feature store stay views shared by workers on one host; sklearn Tree models
+        # (GradientBoosting, RandomForest) copy their nodes into private memory
+        artifacts = load_artifact(model_path)
         
+        self.manifest = artifacts['manifest']
         self.classifier = artifacts['classifier']
         self.regressor = artifacts['regressor']
-        self.scaler = artifacts['scaler']
         self.feature_cols = artifacts['feature_cols']
+        self.transformer = artifacts['transformer']
+        self.feature_store = artifacts['feature_store']
+        self.feature_store_path = feature_store_path
+        self.feature_store_mtime = None
+        self._refresh_feature_store()
         
         print(f"✓ Models loaded successfully")
+        if self.manifest is not None:
+            print(f"  Version: {self.manifest['version']}")
         print(f"  Classifier: {type(self.classifier).__name__}")
         print(f"  Regressor: {type(self.regressor).__name__}")
         print(f"  Feature columns: {len(self.feature_cols)}")
+        if self.feature_store is not None:
+            print(f"  Feature store: {len(self.feature_store.buffers)} boroughs, "
+                  f"latest {self.feature_store.latest_date()}")
+    
+    def _refresh_feature_store(self):
+        """Reload the ingested feature store if it changed on disk."""
+        try:
+            mtime = os.stat(self.feature_store_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self.feature_store_mtime:
+            with open(self.feature_store_path, 'rb') as f:
+                self.feature_store = pickle.load(f)
+            self.feature_store_mtime = mtime
+    
+    def history_features(self, date, borough):
+        """
+        Lag/rolling/observed features for (date, borough) from the feature store.
+        
+        Returns:
+            dict of feature values (empty if no store was saved with the model)
+        """
+        self._refresh_feature_store()
+        if self.feature_store is None:
+            return {}
+        features = self.feature_store.features(date, borough)
+        return {k: v for k, v in features.items() if not pd.isna(v)}
     
     def _prepare_features(self, input_data):
         """
         Prepare input data for prediction.
         
         Args:
-            input_data: dict with feature values or DataFrame
+            input_data: dict (or list of dicts) with feature values, DataFrame,
+                or an already prepared array. A 'borough' value is one-hot
+                encoded; missing features are 0.
             
         Returns:
             numpy array of scaled features
         """
-        # Convert dict to DataFrame if needed
-        if isinstance(input_data, dict):
-            # Create a DataFrame with all feature columns, fill missing with 0
-            df = pd.DataFrame([input_data])
-            
-            # Ensure all required features are present
-            for col in self.feature_cols:
-                if col not in df.columns:
-                    df[col] = 0
-            
-            # Select only the features used in training
-            X = df[self.feature_cols].fillna(0)
-        else:
-            X = input_data[self.feature_cols].fillna(0)
-        
-        # Scale features
-        X_scaled = self.scaler.transform(X)
-        return X_scaled
+        if isinstance(input_data, np.ndarray):
+            return input_data
+        if isinstance(input_data, (dict, list)):
+            return self.transformer.transform(input_data)
+        return self.transformer.transform_matrix(input_data[self.feature_cols])
     
     def predict_classification(self, input_data):
         """
@@ -130,8 +158,9 @@ class ModelService:
         Returns:
             dict with both predictions
         """
-        class_result = self.predict_classification(input_data)
-        reg_result = self.predict_regression(input_data)
+        X = self._prepare_features(input_data)
+        class_result = self.predict_classification(X)
+        reg_result = self.predict_regression(X)
         
         return {
             'classification': class_result,
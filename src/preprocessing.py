@@ -3,6 +3,7 @@ Preprocessing - Clean and merge datasets
 """
 import pandas as pd
 import numpy as np
+from parallel import run_branches
 
 
 def reset_date_index(df, date_col_name='Date'):
@@ -18,6 +19,38 @@ def reset_date_index(df, date_col_name='Date'):
     return df
 
 
+def normalize_borough(values):
+    """Stripped, lower-case borough names (missing values become 'nan').
+    
+    Categorical input is normalized once per category instead of per row.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        names = values.cat.categories.astype(str).str.strip().str.lower()
+        names = np.append(np.asarray(names, dtype=object), 'nan')  # code -1
+        return pd.Series(names[values.cat.codes.to_numpy()], index=values.index, name=values.name)
+    return values.astype(str).str.strip().str.lower()
+
+
+def borough_dtype(valid_boroughs):
+    """Categorical dtype fixing each valid borough's integer code."""
+    return pd.CategoricalDtype(sorted(valid_boroughs))
+
+
+def add_join_key(df, geo_dtype):
+    """Drop rows outside the valid boroughs and add an integer (day, geo) key.
+    
+    The key is days-since-epoch * n_geos + borough code, so sorting by it
+    orders rows by date, then borough.
+    """
+    codes = pd.Categorical(df['borough'], dtype=geo_dtype).codes
+    keep = codes >= 0
+    df = df[keep].copy()
+    days = df['Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    df['_key'] = days * len(geo_dtype.categories) + codes[keep]
+    df['borough'] = pd.Categorical.from_codes(codes[keep], dtype=geo_dtype)
+    return df
+
+
 def prepare_weather_data(df_weather):
     """Clean and prepare weather data."""
     print("\nPreparing weather data...")
@@ -34,7 +67,7 @@ def prepare_weather_data(df_weather):
     keep_cols = ['Date', 'borough'] + [c for c in weather_cols.values() if c in df.columns]
     df = df[[c for c in keep_cols if c in df.columns]].copy()
     
-    df['borough'] = df['borough'].astype(str).str.strip().str.lower()
+    df['borough'] = normalize_borough(df['borough'])
     
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     df = df.groupby(['Date', 'borough'], as_index=False)[numeric_cols.tolist()].mean()
@@ -43,26 +76,27 @@ def prepare_weather_data(df_weather):
     return df
 
 
+def aggregate_counts(df):
+    """Clean a respiratory/asthma frame and sum Count per (Date, borough)."""
+    df = reset_date_index(df, 'Date')
+    df = df.rename(columns={'Dim1Value': 'borough'})
+    df['borough'] = normalize_borough(df['borough'])
+    df['Count'] = pd.to_numeric(df['Count'], errors='coerce')
+    return df.groupby(['Date', 'borough'], as_index=False)['Count'].sum()
+
+
 def prepare_health_data(df_resp, df_asthma, config):
-    """Prepare respiratory and asthma data."""
-    print("\nPreparing health data...")
-    
-    df_resp = reset_date_index(df_resp, 'Date')
-    df_asthma = reset_date_index(df_asthma, 'Date')
-    
-    df_resp = df_resp.rename(columns={'Dim1Value': 'borough'})
-    df_asthma = df_asthma.rename(columns={'Dim1Value': 'borough'})
-    
-    df_resp['borough'] = df_resp['borough'].astype(str).str.strip().str.lower()
-    df_asthma['borough'] = df_asthma['borough'].astype(str).str.strip().str.lower()
+    """Prepare respiratory and asthma data.
     
-    df_resp['Count'] = pd.to_numeric(df_resp['Count'], errors='coerce')
-    df_asthma['Count'] = pd.to_numeric(df_asthma['Count'], errors='coerce')
+    Accepts raw frames or ones already aggregated by aggregate_counts
+    (e.g. streamed in chunks); aggregating twice is a no-op.
+    """
+    print("\nPreparing health data...")
     
-    resp_agg = df_resp.groupby(['Date', 'borough'], as_index=False)['Count'].sum()
+    resp_agg = aggregate_counts(df_resp)
     resp_agg = resp_agg.rename(columns={'Count': 'Respiratory_Count'})
     
-    asth_agg = df_asthma.groupby(['Date', 'borough'], as_index=False)['Count'].sum()
+    asth_agg = aggregate_counts(df_asthma)
     asth_agg = asth_agg.rename(columns={'Count': 'Asthma_Count'})
     
     df_health = pd.merge(resp_agg, asth_agg, on=['Date', 'borough'], how='outer')
@@ -85,30 +119,100 @@ def prepare_health_data(df_resp, df_asthma, config):
     return df_health
 
 
-def prepare_air_quality_data(df_airq):
-    """Clean and prepare air quality data."""
+def aq_column(name):
+    """Feature column name for an air-quality indicator."""
+    return f"AQ_{name.replace(' ', '_')}"
+
+
+def select_pollutants(df, pollutants):
+    """Rows of the listed indicators (raw name or AQ_ column); all rows if none are listed."""
+    if not pollutants:
+        return df
+    wanted = set(pollutants)
+    names = df['Name']
+    matching = [n for n in names.dropna().unique() if n in wanted or aq_column(n) in wanted]
+    return df[names.isin(matching).to_numpy()]
+
+
+def pivot_pollutants(df):
+    """Mean Data Value per (Date, borough) x pollutant, without pivot_table.
+    
+    Keys and indicator names are factorized to integer codes, the means are
+    scattered into a dense (row x pollutant) array with bincount, and rows
+    and columns that are entirely NaN are dropped, as pivot_table does.
+    """
+    df = df.dropna(subset=['Date'])
+    names = df['Name']
+    
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        name_codes = names.cat.codes.to_numpy()
+        name_labels = names.cat.categories
+    else:
+        name_codes, name_labels = pd.factorize(names, sort=True)
+    
+    date_codes, date_labels = pd.factorize(df['Date'], sort=True)
+    geo_codes, geo_labels = pd.factorize(df['borough'], sort=True)
+    key = date_codes.astype(np.int64) * len(geo_labels) + geo_codes
+    row_keys, row_codes = np.unique(key, return_inverse=True)
+    
+    values = df['Data Value'].to_numpy(dtype=np.float64)
+    valid = (name_codes >= 0) & ~np.isnan(values)
+    n_rows, n_cols = len(row_keys), len(name_labels)
+    flat = row_codes[valid] * n_cols + name_codes[valid]
+    
+    sums = np.bincount(flat, weights=values[valid], minlength=n_rows * n_cols)
+    counts = np.bincount(flat, minlength=n_rows * n_cols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dense = (sums / counts).reshape(n_rows, n_cols)
+    dense = dense.astype(df['Data Value'].dtype, copy=False)
+    
+    has_value = (counts > 0).reshape(n_rows, n_cols)
+    rows = has_value.any(axis=1)
+    cols = has_value.any(axis=0)
+    
+    df_pivot = pd.DataFrame(dense[np.ix_(rows, cols)], columns=list(name_labels[cols]))
+    df_pivot.insert(0, 'borough', geo_labels[row_keys[rows] % len(geo_labels)])
+    df_pivot.insert(0, 'Date', date_labels[row_keys[rows] // len(geo_labels)])
+    return df_pivot
+
+
+def prepare_air_quality_data(df_airq, config=None):
+    """Clean and prepare air quality data.
+    
+    With a config, rows outside the valid boroughs are dropped up front and
+    preprocessing.air_quality selects the reshape method and pollutants.
+    """
     print("\nPreparing air quality data...")
     
+    aq_config = (config or {}).get("preprocessing", {}).get("air_quality", {})
+    
     df = reset_date_index(df_airq, 'Start_Date')
     df = df.rename(columns={'Start_Date': 'Date'})
     
     if 'Geo Place Name' in df.columns:
         df = df.rename(columns={'Geo Place Name': 'borough'})
     
-    df['borough'] = df['borough'].astype(str).str.strip().str.lower()
+    df['borough'] = normalize_borough(df['borough'])
+    if config is not None:
+        df = df[df['borough'].isin(config["preprocessing"]["valid_boroughs"])]
     
     if 'Name' in df.columns and 'Data Value' in df.columns:
-        df_pivot = df.pivot_table(
-            index=['Date', 'borough'],
-            columns='Name',
-            values='Data Value',
-            aggfunc='mean'
-        ).reset_index()
+        df = select_pollutants(df, aq_config.get("pollutants"))
+        if aq_config.get("reshape", "codes") == "codes":
+            df_pivot = pivot_pollutants(df)
+        else:
+            df_pivot = df.pivot_table(
+                index=['Date', 'borough'],
+                columns='Name',
+                values='Data Value',
+                aggfunc='mean',
+                observed=True
+            ).reset_index()
         
         df_pivot.columns.name = None
         pollutant_cols = [c for c in df_pivot.columns if c not in ['Date', 'borough']]
         
-        rename_map = {c: f"AQ_{c.replace(' ', '_')}" for c in pollutant_cols}
+        rename_map = {c: aq_column(c) for c in pollutant_cols}
         df_pivot = df_pivot.rename(columns=rename_map)
         
         print(f"✓ Air quality data shape: {df_pivot.shape}")
@@ -118,33 +222,51 @@ def prepare_air_quality_data(df_airq):
 
 
 def merge_all_data(df_weather, df_health, df_airq, config):
-    """Merge all datasets."""
+    """Merge all datasets.
+    
+    Each frame is filtered to the valid boroughs first, then weather and
+    air quality are left-joined onto health by an integer (day, borough) key.
+    """
     print("\nMerging all datasets...")
     
-    df = df_health.copy()
-    df = pd.merge(df, df_weather, on=['Date', 'borough'], how='left')
+    geo_dtype = borough_dtype(config["preprocessing"]["valid_boroughs"])
     
-    if len(df_airq) > 0:
-        df = pd.merge(df, df_airq, on=['Date', 'borough'], how='left')
+    df = add_join_key(df_health, geo_dtype).sort_values('_key').reset_index(drop=True)
     
-    valid_boroughs = config["preprocessing"]["valid_boroughs"]
-    df = df[df['borough'].isin(valid_boroughs)]
+    for other in (df_weather, df_airq):
+        if len(other) == 0:
+            continue
+        right = add_join_key(other, geo_dtype).drop(columns=['Date', 'borough'])
+        right = right.set_index('_key')
+        if not right.index.is_unique:
+            raise ValueError("Expected one row per (Date, borough) before merging")
+        right = right.reindex(df['_key'].to_numpy()).reset_index(drop=True)
+        df = pd.concat([df, right], axis=1)
+    
+    df = df.drop(columns='_key')
     
     print(f"✓ Merged data shape: {df.shape}")
     return df
 
 
 def impute_missing(df):
-    """Impute missing values."""
+    """Impute missing values.
+    
+    Forward/backward fill within each borough, then fall back to the column
+    mean. All numeric columns with gaps are filled in one grouped pass.
+    """
     print("\nImputing missing values...")
     
     df = df.sort_values(['borough', 'Date']).reset_index(drop=True)
     
     numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        df[col] = df.groupby('borough')[col].transform(lambda x: x.ffill().bfill())
-        if df[col].isnull().sum() > 0:
-            df[col].fillna(df[col].mean(), inplace=True)
+    gap_cols = numeric_cols[df[numeric_cols].isna().any().values].tolist()
+    
+    if gap_cols:
+        keys = df['borough']
+        filled = df[gap_cols].groupby(keys, sort=False, observed=True).ffill()
+        filled = filled.groupby(keys, sort=False, observed=True).bfill()
+        df[gap_cols] = filled.fillna(filled.mean())
     
     print(f"✓ Missing values imputed")
     return df
@@ -156,9 +278,15 @@ def preprocess_data(df_weather, df_resp, df_asthma, df_airq, config):
     print("PREPROCESSING DATA")
     print("=" * 60)
     
-    weather_clean = prepare_weather_data(df_weather)
-    health_clean = prepare_health_data(df_resp, df_asthma, config)
-    airq_clean = prepare_air_quality_data(df_airq)
+    # The three branches share no inputs until the merge
+    branches = run_branches({
+        'weather': (prepare_weather_data, (df_weather,)),
+        'health': (prepare_health_data, (df_resp, df_asthma, config)),
+        'air_quality': (prepare_air_quality_data, (df_airq, config)),
+    }, config, label="Preprocessing")
+    weather_clean = branches['weather']
+    health_clean = branches['health']
+    airq_clean = branches['air_quality']
     
     df_merged = merge_all_data(weather_clean, health_clean, airq_clean, config)
     df_final = impute_missing(df_merged)
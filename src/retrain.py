@@ -0,0 +1,212 @@
+"""
+Incremental Retraining - Add stages for newly appended days to the saved models
+"""
+import os
+import glob
+import time
+import numpy as np
+import pandas as pd
+import mlflow
+from sklearn.metrics import accuracy_score, roc_auc_score, r2_score, mean_absolute_error
+from data_loader import load_config
+from feature_engineering import create_features, create_target, feature_grid
+from feature_store import FeatureStore
+from ingest import read_processed
+from engines import get_engine, make_model, fitted_stages
+from train import feature_columns, fill_matrix, stage_record, artifact_dir
+from artifacts import load_artifact, save_artifact, data_hash
+from tracking import RunLogger
+from main import stage_loaders
+
+MODELS = (("classifier", "classification", "High_Risk"), ("regressor", "regression", "Total_Hospitalization"))
+
+
+def load_panel(config):
+    """Latest processed panel: the ingest store if present, else the cached preprocess."""
+    path = config["ingest"]["processed_path"]
+    if glob.glob(os.path.join(path, "*.parquet")):
+        print(f"✓ Processed store loaded: {path}")
+        return read_processed(path)
+    _, _, processed, _ = stage_loaders(config)
+    return processed()
+
+
+def seen_until(history, config):
+    """Last day any saved stage was fit on (end of train_years for older artifacts)."""
+    if history:
+        return pd.Timestamp(max(record['to'] for record in history))
+    return pd.Timestamp(f"{max(config['split']['train_years'])}-12-31")
+
+
+def score(classifier, regressor, X, df):
+    """Scores of the saved models on rows they have not seen."""
+    y_class, y_reg = df['High_Risk'], df['Total_Hospitalization']
+    y_pred = regressor.predict(X)
+    metrics = {
+        'accuracy': accuracy_score(y_class, classifier.predict(X)),
+        'r2': r2_score(y_reg, y_pred), 'mae': mean_absolute_error(y_reg, y_pred)
+    }
+    if y_class.nunique() > 1:
+        metrics['auroc'] = roc_auc_score(y_class, classifier.predict_proba(X)[:, 1])
+    return metrics
+
+
+def class_rows(df, rows, target, classes, max_days):
+    """Rows to warm-start a classifier on: `rows`, widened back by whole days
+    until every class in `classes` is present.
+    
+    A daily batch often holds one High_Risk class; a warm-started classifier
+    fit on it either fails or forgets the other class. The window is not
+    widened further back than max_days before its last day.
+    
+    Returns:
+        row indices, or None if the classes are not all seen within max_days
+    """
+    y = df[target].to_numpy()
+    missing = np.setdiff1d(classes, y[rows])
+    if not len(missing):
+        return rows
+    earlier = y[:rows[0]]
+    found = [np.flatnonzero(earlier == c) for c in missing]
+    if any(not len(f) for f in found):
+        return None
+    dates = df['Date'].to_numpy()
+    first_day = dates[min(f[-1] for f in found)]
+    if first_day < dates[rows[-1]] - np.timedelta64(max_days, 'D'):
+        return None
+    start = np.searchsorted(dates, first_day)
+    return np.arange(start, rows[-1] + 1)
+
+
+def grow(model, model_type, X, y, add_stages):
+    """Warm-start add_stages more rounds/trees fit on (X, y) only.
+    
+    Returns:
+        (first, last) stage index of the added stages
+    """
+    classes = getattr(model, 'classes_', None)
+    if classes is not None and not np.array_equal(np.unique(y), classes):
+        raise ValueError(f"Warm start needs every class {list(classes)} in the new rows, "
+                         f"got {list(np.unique(y))}")
+    param, _ = get_engine(model_type)["warm_start"]
+    first = fitted_stages(model, model_type)
+    if 'early_stopping' in model.get_params():
+        model.set_params(early_stopping=False)
+    model.set_params(warm_start=True, **{param: first + add_stages})
+    model.fit(X, y)
+    return first, fitted_stages(model, model_type)
+
+
+def run_retrain(config_path=None):
+    """Update the saved models with the days appended since they were trained.
+    
+    Engines with warm start (boosting, random forests) keep their stages
+    and add retrain.add_stages more, fit on the new days only. Other
+    engines, or retrain.mode "refit", are refit from scratch on the last
+    retrain.refit_days. The saved scaler and feature layout are kept, so
+    serving inputs stay valid. The result is published as a new artifact
+    version whose history adds the data window each new stage saw.
+    """
+    print("FROM AIR TO CARE - INCREMENTAL RETRAINING")
+    config = load_config(config_path)
+    retrain = config["retrain"]
+    start = time.perf_counter()
+    
+    # Writable arrays: the loaded models keep training
+    model_path = artifact_dir(config)
+    if not os.path.exists(model_path):
+        model_path = f"{config['output']['model_dir']}/models.pkl"  # pre-artifact format
+    artifacts = load_artifact(model_path, mmap=False)
+    history = artifacts.get('history') or []
+    transformer = artifacts['transformer']
+    
+    panel = load_panel(config)
+    df = create_target(create_features(panel.copy(), config), config)
+    df = df.sort_values('Date', kind='stable').reset_index(drop=True)
+    if feature_columns(df) != artifacts['feature_cols']:
+        raise ValueError("Feature layout differs from the saved models; run a full train")
+    
+    since = seen_until(history, config)
+    new = np.flatnonzero((df['Date'] > since).to_numpy())
+    if len(new) < retrain.get("min_new_rows", 1):
+        print(f"✓ Nothing to do: {len(new)} new rows after {since.date()}")
+        return artifacts
+    
+    def matrix(rows):
+        X = fill_matrix(df, artifacts['feature_cols'], rows,
+                        np.dtype(config["split"].get("dtype", "float32")), transformer.missing)
+        return transformer.scale_inplace(X) if artifacts['scaled'] else X
+    
+    X_new = matrix(new)
+    window = (df['Date'].iloc[new[0]], df['Date'].iloc[new[-1]])
+    training_data = {
+        'hash': data_hash(X_new, df['High_Risk'].iloc[new], df['Total_Hospitalization'].iloc[new]),
+        'rows': len(new), 'from': str(window[0].date()), 'to': str(window[1].date())
+    }
+    print(f"✓ {len(new)} new rows, {window[0].date()} to {window[1].date()}")
+    previous = score(artifacts['classifier'], artifacts['regressor'], X_new, df.iloc[new])
+    
+    records = []
+    for name, task, target in MODELS:
+        model_type = config[task]["model_type"]
+        model = artifacts[name]
+        if retrain.get("mode", "auto") == "auto" and get_engine(model_type).get("warm_start"):
+            rows, X, stage_hash = new, X_new, training_data['hash']
+            if hasattr(model, 'classes_'):
+                rows = class_rows(df, new, target, model.classes_, retrain.get("refit_days", 365))
+                if rows is None:
+                    print(f"⚠ {name}: new rows lack a class of {list(model.classes_)} "
+                          f"within {retrain.get('refit_days', 365)} days; kept unchanged")
+                    continue
+                if len(rows) > len(new):
+                    X = matrix(rows)
+                    stage_hash = data_hash(X, df[target].iloc[rows])
+            first, last = grow(model, model_type, X, df[target].iloc[rows],
+                               retrain.get("add_stages", 20))
+            stage_window = (df['Date'].iloc[rows[0]], window[1])
+            records.append(stage_record(name, model, model_type, "warm_start", stage_window,
+                                        len(rows), first, data_hash=stage_hash))
+            print(f"  {name}: stages {first}-{last} added on {len(rows)} rows "
+                  f"from {stage_window[0].date()}")
+        else:
+            refit_from = window[1] - pd.Timedelta(days=retrain.get("refit_days", 365))
+            rows = np.flatnonzero((df['Date'] > refit_from).to_numpy())
+            X, y = matrix(rows), df[target].iloc[rows]
+            model = make_model(config[task], transformer.categorical_features)
+            model.fit(X, y)
+            artifacts[name] = model
+            refit_window = (df['Date'].iloc[rows[0]], window[1])
+            records.append(stage_record(name, model, model_type, "refit", refit_window, len(rows),
+                                        data_hash=data_hash(X, y)))
+            print(f"  {name}: refit on {len(rows)} rows from {refit_window[0].date()}")
+    
+    # A refit replaces every stage, so that model's older records no longer apply
+    refit = {record['model'] for record in records if record['mode'] == "refit"}
+    history = [record for record in history if record['model'] not in refit] + records
+    
+    feature_store = FeatureStore.from_frame(
+        panel, feature_grid(config), horizon=config["features"].get("store_horizon", 7)
+    )
+    model_path = save_artifact(
+        artifact_dir(config), artifacts['classifier'], artifacts['regressor'], transformer,
+        config, feature_store=feature_store, history=history, training_data=training_data,
+        scaled=artifacts['scaled'], keep=config["output"].get("keep_artifacts", 3)
+    )
+    print(f"\n Models saved to {model_path}")
+    seconds = time.perf_counter() - start
+    
+    mlflow.set_tracking_uri(config["mlflow"]["tracking_uri"])
+    mlflow.set_experiment(config["mlflow"]["experiment_name"])
+    with mlflow.start_run(run_name="retrain"), RunLogger() as tracker:
+        tracker.log_params({"from": str(window[0].date()), "to": str(window[1].date()),
+                            "new_rows": len(new)})
+        for record in records:
+            tracker.log_params({"mode": record['mode'], "stages": record['stages']},
+                               prefix=f"{record['model']}_")
+        tracker.log_metrics(previous, prefix="prev_")
+        tracker.log_metrics({"retrain_seconds": seconds})
+        tracker.log_artifact(model_path)
+    
+    print(f"\n✓ Retrain complete in {seconds:.1f}s; scores of the previous models on the new "
+          f"days: " + ", ".join(f"{k} {v:.4f}" for k, v in previous.items()))
+    return artifacts
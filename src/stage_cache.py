@@ -0,0 +1,124 @@
+"""
+Stage Cache - Content-addressed cache for pipeline stage outputs
+"""
+import os
+import sys
+import json
+import types
+import pickle
+import hashlib
+
+# Project modules are the ones loaded from this directory
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def project_modules(*modules):
+    """The given modules plus every project module they import, transitively.
+    
+    A module counts as imported when it, or a function/class from it, is
+    bound in the importer's namespace (import x / from x import y).
+    """
+    found, pending = {}, list(modules)
+    while pending:
+        module = pending.pop()
+        if module.__name__ in found:
+            continue
+        found[module.__name__] = module
+        for value in vars(module).values():
+            name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, "__module__", None)
+            dependency = sys.modules.get(name) if isinstance(name, str) else None
+            path = getattr(dependency, "__file__", None)
+            if path and os.path.dirname(os.path.abspath(path)) == PROJECT_DIR:
+                pending.append(dependency)
+    return [found[name] for name in sorted(found)]
+
+
+def source_digest(*modules):
+    """SHA-256 over the source files of the given modules and the project modules they import."""
+    sha = hashlib.sha256()
+    for module in project_modules(*modules):
+        sha.update(module.__name__.encode())
+        with open(module.__file__, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+class StageCache:
+    """Stores each stage's output on disk under a hash of everything it read.
+    
+    A stage key combines its parent stage's key, the config sections the
+    stage reads and the source of the code that computes it, so changing
+    any of them invalidates that stage and everything downstream. Only the
+    `keep` most recently used entries of each stage stay on disk.
+    """
+
+    def __init__(self, cache_config=None):
+        cache_config = cache_config or {}
+        self.enabled = cache_config.get("enabled", False)
+        self.cache_dir = cache_config.get("dir", "data/stage_cache")
+        self.keep = cache_config.get("keep", 3)
+        self.log = []
+
+    def key(self, stage, parent_key, config, sections, code=""):
+        """Key for a stage from its inputs, config sections and code digest."""
+        payload = json.dumps({
+            "stage": stage,
+            "parent": parent_key,
+            "config": {section: config.get(section) for section in sections},
+            "code": code,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key[:16]}.pkl")
+
+    def load(self, stage, key):
+        """Return the cached output of a stage, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            print(f"  Cache miss: {stage}")
+            self.log.append((stage, "miss"))
+            return None
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+        os.utime(path)  # Mark as recently used for eviction
+        print(f"✓ Cache hit: {stage} ({key[:16]})")
+        self.log.append((stage, "hit"))
+        return result
+
+    def save(self, stage, key, result):
+        """Store a stage's output (no-op when disabled).
+        
+        Returns:
+            key prefixes of the entries evicted to make room
+        """
+        if not self.enabled:
+            return []
+        path = self.path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.evict(stage)
+
+    def evict(self, stage):
+        """Delete all but the `keep` most recently used entries of a stage."""
+        if not self.keep:
+            return []
+        stage_dir = os.path.join(self.cache_dir, stage)
+        entries = [name for name in os.listdir(stage_dir) if name.endswith(".pkl")]
+        entries.sort(key=lambda name: os.path.getmtime(os.path.join(stage_dir, name)), reverse=True)
+        for name in entries[self.keep:]:
+            os.remove(os.path.join(stage_dir, name))
+        return [name[:-len(".pkl")] for name in entries[self.keep:]]
+
+    def summary(self):
+        """Print hit/miss per stage for this run."""
+        if not self.enabled:
+            return
+        print("\nStage cache:")
+        for stage, status in self.log:
+            print(f"  {stage}: {status}")
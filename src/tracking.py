@@ -0,0 +1,121 @@
+"""
+Tracking - Batched MLflow logging with artifacts rendered and uploaded off the critical path
+"""
+import os
+import time
+import numbers
+from importlib import metadata
+import matplotlib
+matplotlib.use("Agg")
+import mlflow
+import mlflow.sklearn
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+
+# Packages an sklearn model needs to be unpickled, pinned to this environment
+MODEL_PACKAGES = ("scikit-learn", "numpy", "scipy", "cloudpickle")
+
+# MLflow caps a single log_batch call at 100 params / 1000 metrics
+MAX_BATCH_PARAMS = 100
+MAX_BATCH_METRICS = 1000
+
+
+def model_requirements():
+    """Pinned pip requirements for logged models, from the installed versions.
+    
+    Passing these skips MLflow's requirement inference, which reloads the
+    model in a subprocess (several seconds per model).
+    """
+    return [f"{name}=={metadata.version(name)}" for name in MODEL_PACKAGES]
+
+
+class RunLogger:
+    """Buffers params/metrics for one run and queues artifact work in the background.
+    
+    Params and metrics are sent with log_batch at flush() instead of one
+    request per value. Plots and models are rendered, saved and uploaded
+    by a single worker thread, one after another, using the run id
+    explicitly (MLflow's active run is thread-local). The worker draws
+    every plot on the same Agg figure, cleared between plots.
+    
+    Models are logged with pinned requirements unless infer_requirements
+    is set.
+    """
+    
+    def __init__(self, run_id=None, figsize=(8, 6), infer_requirements=False):
+        self.run_id = run_id or mlflow.active_run().info.run_id
+        self.client = MlflowClient()
+        self.params = {}
+        self.metrics = {}
+        self.figure = Figure(figsize=figsize)
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlflow-log")
+        self.jobs = []
+        self.pip_requirements = None if infer_requirements else model_requirements()
+    
+    def log_params(self, params, prefix=""):
+        """Buffer params (stringified, as MLflow stores them)."""
+        self.params.update({f"{prefix}{key}": str(value) for key, value in params.items()})
+    
+    def log_metrics(self, metrics, prefix=""):
+        """Buffer numeric metrics; non-numeric entries (arrays, Series) are skipped."""
+        for key, value in metrics.items():
+            if isinstance(value, numbers.Real) and not isinstance(value, bool):
+                self.metrics[f"{prefix}{key}"] = float(value)
+    
+    def log_plot(self, plot, *args, save_path):
+        """Queue plot(*args, save_path, fig=...) on the shared figure, then upload it."""
+        def job():
+            path = plot(*args, save_path, fig=self.figure)
+            self.client.log_artifact(self.run_id, path)
+        self.jobs.append(self.worker.submit(job))
+    
+    def log_artifact(self, path, artifact_path=None):
+        """Queue upload of a local file (or a directory, under its own name)."""
+        if os.path.isdir(path):
+            artifact_path = artifact_path or os.path.basename(os.path.normpath(path))
+            self.jobs.append(self.worker.submit(self.client.log_artifacts, self.run_id, path, artifact_path))
+        else:
+            self.jobs.append(self.worker.submit(self.client.log_artifact, self.run_id, path, artifact_path))
+    
+    def log_model(self, model, artifact_path):
+        """Queue serialization and upload of an sklearn model."""
+        self.jobs.append(self.worker.submit(
+            mlflow.models.Model.log, artifact_path=artifact_path, flavor=mlflow.sklearn,
+            sk_model=model, run_id=self.run_id, pip_requirements=self.pip_requirements
+        ))
+    
+    def flush(self):
+        """Send buffered params/metrics, then wait for queued artifacts.
+        
+        Returns:
+            seconds spent waiting on the background worker
+        """
+        params = [Param(key, value) for key, value in self.params.items()]
+        timestamp = int(time.time() * 1000)
+        metrics = [Metric(key, value, timestamp, 0) for key, value in self.metrics.items()]
+        for i in range(0, len(params), MAX_BATCH_PARAMS):
+            self.client.log_batch(self.run_id, params=params[i:i + MAX_BATCH_PARAMS])
+        for i in range(0, len(metrics), MAX_BATCH_METRICS):
+            self.client.log_batch(self.run_id, metrics=metrics[i:i + MAX_BATCH_METRICS])
+        self.params, self.metrics = {}, {}
+        
+        start = time.perf_counter()
+        jobs, self.jobs = self.jobs, []
+        for job in jobs:
+            job.result()
+        return time.perf_counter() - start
+    
+    def close(self):
+        """Flush and stop the worker."""
+        waited = self.flush()
+        self.worker.shutdown()
+        return waited
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
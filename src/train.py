@@ -3,129 +3,351 @@ Model Training with MLFlow Tracking
 """
 import pandas as pd
 import numpy as np
-import pickle
 import os
+import time
+import inspect
 import mlflow
 import mlflow.sklearn
-import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor
+from engines import make_model, get_engine, is_tree_model, handles_missing, fitted_stages
+from parallel import run_branches
+from tracking import RunLogger
+from matplotlib.figure import Figure
+from transformer import FeatureTransformer
+from artifacts import save_artifact, data_hash
+from preprocessing import borough_dtype
+from scipy.special import expit, softmax
+from threadpoolctl import threadpool_limits
 from sklearn.metrics import (
-    accuracy_score, roc_auc_score, recall_score, precision_score, f1_score,
+    accuracy_score, roc_auc_score, recall_score, precision_score, f1_score, log_loss,
     mean_squared_error, mean_absolute_error, r2_score,
     confusion_matrix, roc_curve
 )
 
 
-def prepare_splits(df, config):
-    """Split data into train/val/test."""
-    
-    print("PREPARING DATA SPLITS")
-    
-    
+def needs_scaling(config):
+    """Whether split matrices are standardized (split.scale: auto/true/false)."""
+    scale = config["split"].get("scale", "auto")
+    if scale == "auto":
+        model_types = [config[task]["model_type"] for task in ("classification", "regression")]
+        return not all(is_tree_model(model_type) for model_type in model_types)
+    return bool(scale)
+
+
+def keeps_missing(config):
+    """Whether NaN is left in split matrices (both models handle it natively)."""
+    return all(handles_missing(config[task]["model_type"]) for task in ("classification", "regression"))
+
+
+def allocate_matrix(shape, dtype, path=None):
+    """C-contiguous feature buffer, in memory or as an on-disk .npy memmap."""
+    if path is None:
+        return np.empty(shape, dtype=dtype, order='C')
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+
+def feature_columns(df):
+    """Model input columns: everything but dates, targets and health counts."""
     exclude_cols = [
         'Date', 'Total_Hospitalization', 'Respiratory_Count',
         'Asthma_Count', 'High_Risk', 'year'
     ]
     exclude_cols += [c for c in df.columns if 'year' in c.lower()]
+    return [c for c in df.columns if c not in exclude_cols]
+
+
+def fill_matrix(df, feature_cols, order, dtype, missing, path=None):
+    """Write df rows (in `order`) into a new feature buffer, column by column."""
+    X = allocate_matrix((len(order), len(feature_cols)), dtype, path)
+    for j, col in enumerate(feature_cols):
+        X[:, j] = np.nan_to_num(df[col].to_numpy(dtype=np.float64, na_value=np.nan)[order], nan=missing)
+    return X
+
+
+def split_views(splits):
+    """Set X_train/X_val/X_test to row-range views of splits['X']."""
+    n_train, n_val, n_test = splits['bounds']
+    X = splits['X']
+    splits['X_train'] = X[:n_train]
+    splits['X_val'] = X[n_train:n_train + n_val]
+    splits['X_test'] = X[n_train + n_val:n_train + n_val + n_test]
+    return splits
+
+
+def detach_matrix(splits):
+    """Copy of splits without the memmapped buffer (for the stage cache)."""
+    if splits.get('matrix_path') is None:
+        return splits
+    return {k: v for k, v in splits.items() if k not in ('X', 'X_train', 'X_val', 'X_test')}
+
+
+def attach_matrix(splits):
+    """Reopen a memmapped buffer read-only; None if the file is gone."""
+    if splits is None or splits.get('matrix_path') is None or 'X' in splits:
+        return splits
+    if not os.path.exists(splits['matrix_path']):
+        return None
+    splits = dict(splits, X=np.load(splits['matrix_path'], mmap_mode='r'))
+    return split_views(splits)
+
+
+def prepare_splits(df, config, name="splits"):
+    """Split data into train/val/test.
     
-    feature_cols = [c for c in df.columns if c not in exclude_cols]
-    
-    X = df[feature_cols].fillna(0)
-    y_class = df['High_Risk']
-    y_reg = df['Total_Hospitalization']
-    dates = df['Date']
-    
-    years = dates.dt.year
-    train_years = config["split"]["train_years"]
-    val_year = config["split"]["val_year"]
-    test_year = config["split"]["test_year"]
-    
-    train_mask = years.isin(train_years)
-    val_mask = years == val_year
-    test_mask = years == test_year
+    Rows are ordered train, val, test once and written into a single
+    C-contiguous buffer (split.dtype, float32 by default; memmapped under
+    split.memmap_dir if set). Each split is a row-range view of it, and the
+    buffer is standardized in place only if needs_scaling(config).
+    """
     
-    X_train, X_val, X_test = X[train_mask], X[val_mask], X[test_mask]
-    y_class_train, y_class_val, y_class_test = y_class[train_mask], y_class[val_mask], y_class[test_mask]
-    y_reg_train, y_reg_val, y_reg_test = y_reg[train_mask], y_reg[val_mask], y_reg[test_mask]
+    print("PREPARING DATA SPLITS")
     
-    print(f" Train: {X_train.shape}")
-    print(f" Val: {X_val.shape}")
-    print(f" Test: {X_test.shape}")
     
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_val_scaled = scaler.transform(X_val)
-    X_test_scaled = scaler.transform(X_test)
+    feature_cols = feature_columns(df)
     
-    return {
-        'X_train': X_train_scaled, 'X_val': X_val_scaled, 'X_test': X_test_scaled,
-        'y_class_train': y_class_train, 'y_class_val': y_class_val, 'y_class_test': y_class_test,
-        'y_reg_train': y_reg_train, 'y_reg_val': y_reg_val, 'y_reg_test': y_reg_test,
-        'feature_cols': feature_cols, 'scaler': scaler
-    }
+    split_config = config["split"]
+    years = df['Date'].dt.year.to_numpy()
+    masks = [
+        np.isin(years, split_config["train_years"]),
+        years == split_config["val_year"],
+        years == split_config["test_year"],
+    ]
+    bounds = tuple(int(mask.sum()) for mask in masks)
+    order = np.concatenate([np.flatnonzero(mask) for mask in masks])
+    train_dates = df['Date'].iloc[order[:bounds[0]]]
+    
+    # Fill column by column so no full-width float64 copy is made; NaN
+    # becomes 0 unless both engines handle missing values natively
+    missing = np.nan if keeps_missing(config) else 0.0
+    dtype = np.dtype(split_config.get("dtype", "float32"))
+    memmap_dir = split_config.get("memmap_dir")
+    matrix_path = os.path.join(memmap_dir, f"{name}.npy") if memmap_dir else None
+    X = fill_matrix(df, feature_cols, order, dtype, missing, matrix_path)
+    
+    y_class = df['High_Risk'].iloc[order]
+    y_reg = df['Total_Hospitalization'].iloc[order]
+    n_train, n_val, _ = bounds
+    
+    # Training and serving scale through the same compiled transformer
+    # (an integer borough_code column is left unscaled)
+    scaler = StandardScaler().fit(X[:n_train]) if needs_scaling(config) else None
+    codes = {'borough': list(borough_dtype(config["preprocessing"]["valid_boroughs"]).categories)}
+    transformer = FeatureTransformer.from_scaler(feature_cols, scaler, codes=codes, missing=missing)
+    if scaler is not None:
+        transformer.scale_inplace(X)
+    if matrix_path is not None:
+        X.flush()
+    
+    splits = split_views({
+        'X': X, 'bounds': bounds, 'matrix_path': matrix_path,
+        'y_class_train': y_class.iloc[:n_train], 'y_class_val': y_class.iloc[n_train:n_train + n_val],
+        'y_class_test': y_class.iloc[n_train + n_val:],
+        'y_reg_train': y_reg.iloc[:n_train], 'y_reg_val': y_reg.iloc[n_train:n_train + n_val],
+        'y_reg_test': y_reg.iloc[n_train + n_val:],
+        'feature_cols': feature_cols, 'scaler': scaler, 'transformer': transformer,
+        'categorical_features': transformer.categorical_features,
+        'train_window': (train_dates.min(), train_dates.max())
+    })
+    
+    print(f" Train: {splits['X_train'].shape}")
+    print(f" Val: {splits['X_val'].shape}")
+    print(f" Test: {splits['X_test'].shape}")
+    print(f" Matrix: {dtype.name}, {X.nbytes / 1e6:.1f} MB"
+          f"{', memmapped at ' + matrix_path if matrix_path else ''}"
+          f"{'' if scaler is not None else ', unscaled (tree models)'}")
+    
+    return splits
 
 
-def plot_confusion_matrix(y_true, y_pred, save_path):
-    """Create and save confusion matrix plot."""
+def plot_confusion_matrix(y_true, y_pred, save_path, fig=None):
+    """Create and save confusion matrix plot (on `fig`, cleared first, if given)."""
     cm = confusion_matrix(y_true, y_pred)
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+    fig = fig or Figure(figsize=(8, 6))
+    fig.clear()
+    ax = fig.add_subplot()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax,
                 xticklabels=['Normal', 'High Risk'],
                 yticklabels=['Normal', 'High Risk'])
-    plt.xlabel('Predicted')
-    plt.ylabel('Actual')
-    plt.title('Confusion Matrix')
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.close()
+    ax.set_xlabel('Predicted')
+    ax.set_ylabel('Actual')
+    ax.set_title('Confusion Matrix')
+    fig.tight_layout()
+    fig.savefig(save_path)
     return save_path
 
 
-def plot_roc_curve(y_true, y_proba, save_path):
+def plot_roc_curve(y_true, y_proba, save_path, fig=None):
     """Create and save ROC curve plot."""
     fpr, tpr, _ = roc_curve(y_true, y_proba)
     auc = roc_auc_score(y_true, y_proba)
     
-    plt.figure(figsize=(8, 6))
-    plt.plot(fpr, tpr, label=f'ROC Curve (AUC = {auc:.3f})')
-    plt.plot([0, 1], [0, 1], 'k--', label='Random')
-    plt.xlabel('False Positive Rate')
-    plt.ylabel('True Positive Rate')
-    plt.title('ROC Curve')
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.close()
+    fig = fig or Figure(figsize=(8, 6))
+    fig.clear()
+    ax = fig.add_subplot()
+    ax.plot(fpr, tpr, label=f'ROC Curve (AUC = {auc:.3f})')
+    ax.plot([0, 1], [0, 1], 'k--', label='Random')
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title('ROC Curve')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(save_path)
     return save_path
 
 
-def plot_predictions(y_true, y_pred, save_path):
+def plot_predictions(y_true, y_pred, save_path, fig=None):
     """Create and save predicted vs actual plot."""
-    plt.figure(figsize=(8, 6))
-    plt.scatter(y_true, y_pred, alpha=0.5)
-    plt.plot([y_true.min(), y_true.max()], [y_true.min(), y_true.max()], 'r--')
-    plt.xlabel('Actual')
-    plt.ylabel('Predicted')
-    plt.title('Predicted vs Actual')
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.close()
+    fig = fig or Figure(figsize=(8, 6))
+    fig.clear()
+    ax = fig.add_subplot()
+    ax.scatter(y_true, y_pred, alpha=0.5)
+    ax.plot([y_true.min(), y_true.max()], [y_true.min(), y_true.max()], 'r--')
+    ax.set_xlabel('Actual')
+    ax.set_ylabel('Predicted')
+    ax.set_title('Predicted vs Actual')
+    fig.tight_layout()
+    fig.savefig(save_path)
     return save_path
 
 
+def stage_proba(model, raw):
+    """Class probabilities from a GradientBoostingClassifier decision function."""
+    if raw.ndim > 1 and raw.shape[1] > 1:
+        return softmax(raw, axis=1)
+    raw = raw.ravel()
+    proba = expit(2 * raw if model.loss == "exponential" else raw)
+    return np.column_stack([1 - proba, proba])
+
+
+def val_losses(model, X_val, y_val, state):
+    """Validation loss (log loss / MSE) after each boosting round not yet scored.
+    
+    `state` keeps the raw prediction after the last scored round, so each
+    check adds only the new trees' predictions instead of replaying every
+    stage from the first.
+    """
+    n_stages = model.estimators_.shape[0]
+    if 'raw' in state:
+        raw, raws = state['raw'], []
+        for trees in model.estimators_[state['stages']:n_stages]:
+            step = np.column_stack([tree.predict(X_val) for tree in trees]).reshape(raw.shape)
+            raw = raw + model.learning_rate * step
+            raws.append(raw)
+    elif hasattr(model, 'predict_proba'):
+        raws = list(model.staged_decision_function(X_val))
+    else:
+        raws = list(model.staged_predict(X_val))
+    state.update(raw=raws[-1], stages=n_stages)
+    
+    if hasattr(model, 'predict_proba'):
+        return [log_loss(y_val, stage_proba(model, raw), labels=model.classes_) for raw in raws]
+    return [mean_squared_error(y_val, raw) for raw in raws]
+
+
+def keep_rounds(model, n_rounds):
+    """Drop GradientBoosting rounds after the first n_rounds, as its own early stopping does."""
+    model.estimators_ = model.estimators_[:n_rounds]
+    model.train_score_ = model.train_score_[:n_rounds]
+    if hasattr(model, 'oob_improvement_'):
+        model.oob_improvement_ = model.oob_improvement_[:n_rounds]
+        model.oob_scores_ = model.oob_scores_[:n_rounds]
+        model.oob_score_ = model.oob_scores_[-1]
+    model.n_estimators_ = n_rounds
+    model.set_params(n_estimators=n_rounds)
+    return model
+
+
+def fit_model(model, splits, target, task_config, config):
+    """Fit on the train split, early-stopping boosting engines on the val year.
+    
+    HistGradientBoosting stops natively, on the val year where its fit()
+    takes X_val/y_val (scikit-learn >= 1.7) and on its own
+    validation_fraction of the train rows before that. GradientBoosting is
+    grown check_every rounds at a time (warm start) until the validation
+    loss has not improved by more than tol for `patience` rounds, or the
+    n_estimators budget is spent. Engines without boosting rounds are fit
+    as usual.
+    
+    Returns:
+        (model, dict with best_iteration/n_iter/best_val_loss, or None)
+    """
+    X_train, y_train = splits['X_train'], splits[f'{target}_train']
+    early_stopping = config.get("early_stopping", {})
+    rounds = get_engine(task_config["model_type"]).get("iterations")
+    if not early_stopping.get("enabled") or rounds is None or len(splits['X_val']) == 0:
+        return model.fit(X_train, y_train), None
+    
+    X_val, y_val = splits['X_val'], splits[f'{target}_val']
+    budget = model.get_params()[rounds]
+    step = early_stopping.get("check_every", 10)
+    patience = early_stopping.get("patience", 10)
+    tol = early_stopping.get("tol", 0.0)
+    
+    if 'early_stopping' in model.get_params():
+        model.set_params(early_stopping=True, n_iter_no_change=patience, tol=tol)
+        if 'X_val' in inspect.signature(model.fit).parameters:
+            model.fit(X_train, y_train, X_val=X_val, y_val=y_val)
+        else:
+            print(f" Early stopping on validation_fraction {model.validation_fraction} of the "
+                  f"train rows (X_val in fit() needs scikit-learn >= 1.7)")
+            model.fit(X_train, y_train)
+        scores = model.validation_score_  # negated loss, from round 0
+        best_iteration = int(np.argmax(scores))
+        best_loss = -float(scores[best_iteration])
+        losses = scores[1:]
+    else:
+        losses, best_loss, best_iteration = early_stop_rounds(
+            model, X_train, y_train, X_val, y_val, rounds, budget, step, patience, tol
+        )
+    
+    print(f" Early stopping: best iteration {best_iteration} of {len(losses)} "
+          f"(budget {budget}, val loss {best_loss:.4f})")
+    return model, {'best_iteration': best_iteration, 'n_iter': len(losses), 'best_val_loss': best_loss}
+
+
+def early_stop_rounds(model, X_train, y_train, X_val, y_val, rounds, budget, step, patience, tol):
+    """Warm-start `step` rounds at a time until val loss stops improving.
+    
+    The rounds fit past the best one (patience, plus the overshoot of the
+    last step) are dropped, so the model returned is the best one.
+    """
+    model.set_params(warm_start=True)
+    losses, best_loss, best_iteration = [], np.inf, 0
+    state = {}
+    while len(losses) < budget and len(losses) - best_iteration < patience:
+        model.set_params(**{rounds: min(len(losses) + step, budget)})
+        model.fit(X_train, y_train)
+        for loss in val_losses(model, X_val, y_val, state):
+            losses.append(loss)
+            if loss < best_loss - tol:
+                best_loss, best_iteration = loss, len(losses)
+    keep_rounds(model, best_iteration)
+    return losses, best_loss, best_iteration
+
+
+def fit_with_threads(train, threads, splits, config):
+    """Run train(splits, config) with BLAS/OpenMP capped at `threads` (None: no cap).
+    
+    The cap is set in the thread (or process) that fits, so two concurrent
+    HistGradientBoosting fits do not each start one OpenMP thread per core.
+    """
+    with threadpool_limits(limits=threads):
+        return train(splits, config)
+
+
 def train_classifier(splits, config):
     """Train classification model with MLFlow tracking."""
     
     print("TRAINING CLASSIFICATION MODEL")
     
     
-    params = config["classification"]["params"]
-    model = GradientBoostingClassifier(**params)
+    model = make_model(config["classification"], splits.get('categorical_features'))
+    print(f" Engine: {type(model).__name__}")
     
     # Train
-    model.fit(splits['X_train'], splits['y_class_train'])
+    model, stopping = fit_model(model, splits, 'y_class', config["classification"], config)
     
     # Predict
     y_pred = model.predict(splits['X_test'])
@@ -146,6 +368,8 @@ def train_classifier(splits, config):
     print(f" Precision: {metrics['precision']:.4f}")
     print(f" F1: {metrics['f1']:.4f}")
     
+    metrics.update(stopping or {})
+    
     # Store predictions for plotting
     metrics['y_pred'] = y_pred
     metrics['y_proba'] = y_proba
@@ -160,11 +384,11 @@ def train_regressor(splits, config):
     print("TRAINING REGRESSION MODEL")
     
     
-    params = config["regression"]["params"]
-    model = GradientBoostingRegressor(**params)
+    model = make_model(config["regression"], splits.get('categorical_features'))
+    print(f" Engine: {type(model).__name__}")
     
     # Train
-    model.fit(splits['X_train'], splits['y_reg_train'])
+    model, stopping = fit_model(model, splits, 'y_reg', config["regression"], config)
     
     # Predict
     y_pred = model.predict(splits['X_test'])
@@ -180,6 +404,8 @@ def train_regressor(splits, config):
     print(f"MAE: {metrics['mae']:.2f}")
     print(f"RMSE: {metrics['rmse']:.2f}")
     
+    metrics.update(stopping or {})
+    
     # Store predictions for plotting
     metrics['y_pred'] = y_pred
     metrics['y_true'] = splits['y_reg_test']
@@ -187,27 +413,41 @@ def train_regressor(splits, config):
     return model, metrics
 
 
-def save_models(classifier, regressor, scaler, feature_cols, config):
-    """Save trained models."""
-    model_dir = config["output"]["model_dir"]
-    os.makedirs(model_dir, exist_ok=True)
-    
-    artifacts = {
-        'classifier': classifier,
-        'regressor': regressor,
-        'scaler': scaler,
-        'feature_cols': feature_cols
+def stage_record(name, model, model_type, mode, window, rows, first=0, data_hash=None):
+    """History entry: the data window a model's stages [first, last) were fit on."""
+    last = fitted_stages(model, model_type) if get_engine(model_type).get("warm_start") else None
+    return {
+        'model': name, 'mode': mode, 'from': str(window[0].date()), 'to': str(window[1].date()),
+        'rows': int(rows), 'stages': [first, last], 'data_hash': data_hash,
+        'trained_at': pd.Timestamp.now().isoformat(timespec='seconds')
     }
-    
-    model_path = f"{model_dir}/models.pkl"
-    with open(model_path, 'wb') as f:
-        pickle.dump(artifacts, f)
+
+
+def artifact_dir(config):
+    """Root of the versioned model artifacts (output.artifact_dir)."""
+    output = config["output"]
+    return output.get("artifact_dir") or os.path.join(output["model_dir"], "artifacts")
+
+
+def save_models(classifier, regressor, scaler, feature_cols, config,
+                feature_store=None, transformer=None, history=None, training_data=None):
+    """Save trained models as a new artifact version (see artifacts.py), with the
+    serving transformer, feature store and training history."""
+    artifact_root = artifact_dir(config)
+    os.makedirs(artifact_root, exist_ok=True)
+    
+    model_path = save_artifact(
+        artifact_root, classifier, regressor,
+        transformer or FeatureTransformer.from_scaler(feature_cols, scaler),
+        config, feature_store=feature_store, history=history, training_data=training_data,
+        scaled=scaler is not None, keep=config["output"].get("keep_artifacts", 3)
+    )
     
     print(f"\n Models saved to {model_path}")
     return model_path
 
 
-def run_mlflow_experiment(splits, config):
+def run_mlflow_experiment(splits, config, feature_store=None):
     """Run full training with MLFlow experiment tracking."""
     
     # Setup MLFlow
@@ -219,84 +459,83 @@ def run_mlflow_experiment(splits, config):
     print(f"MLFLOW EXPERIMENT: {mlflow_config['experiment_name']}")
       
     # Start MLFlow run
-    with mlflow.start_run(run_name="gradient_boosting_run"):
-        
-        # Log parameters
-        print("\nLogging parameters...")
-        mlflow.log_param("model_type_class", config["classification"]["model_type"])
-        mlflow.log_param("model_type_reg", config["regression"]["model_type"])
-        
-        for key, value in config["classification"]["params"].items():
-            mlflow.log_param(f"class_{key}", value)
-        
-        for key, value in config["regression"]["params"].items():
-            mlflow.log_param(f"reg_{key}", value)
-        
-        mlflow.log_param("threshold_percentile", config["target"]["threshold_percentile"])
-        mlflow.log_param("train_years", str(config["split"]["train_years"]))
-        mlflow.log_param("test_year", config["split"]["test_year"])
+    start = time.perf_counter()
+    with mlflow.start_run(run_name=f"{config['classification']['model_type']}_run"), \
+            RunLogger(infer_requirements=mlflow_config.get("infer_requirements", False)) as tracker:
         
-        # Train classification model
-        classifier, class_metrics = train_classifier(splits, config)
+        # Parameters are buffered and sent in one batch when the run closes
+        tracker.log_params({
+            "model_type_class": config["classification"]["model_type"],
+            "model_type_reg": config["regression"]["model_type"],
+            "threshold_percentile": config["target"]["threshold_percentile"],
+            "train_years": config["split"]["train_years"],
+            "test_year": config["split"]["test_year"],
+        })
+        tracker.log_params(config["classification"]["params"], prefix="class_")
+        tracker.log_params(config["regression"]["params"], prefix="reg_")
         
-        # Log classification metrics
-        print("\n Logging classification metrics...")
-        mlflow.log_metric("accuracy", class_metrics['accuracy'])
-        mlflow.log_metric("auroc", class_metrics['auroc'])
-        mlflow.log_metric("recall", class_metrics['recall'])
-        mlflow.log_metric("precision", class_metrics['precision'])
-        mlflow.log_metric("f1", class_metrics['f1'])
+        early_stopping = config.get("early_stopping", {})
+        tracker.log_params({"early_stopping": early_stopping.get("enabled", False)})
+        if early_stopping.get("enabled"):
+            tracker.log_params({
+                "early_stopping_patience": early_stopping.get("patience", 10),
+                "early_stopping_tol": early_stopping.get("tol", 0.0),
+            })
         
-        # Train regression model
-        regressor, reg_metrics = train_regressor(splits, config)
+        # Train both models; they share the split arrays but nothing else.
+        # Concurrent fits split the cores between them.
+        executor = config.get("execution", {}).get("train_executor", "serial")
+        threads = None if executor == "serial" else max(1, (os.cpu_count() or 1) // 2)
+        trained = run_branches({
+            'classifier': (fit_with_threads, (train_classifier, threads, splits, config)),
+            'regressor': (fit_with_threads, (train_regressor, threads, splits, config)),
+        }, config, label="Training", executor=executor)
+        classifier, class_metrics = trained['classifier']
+        regressor, reg_metrics = trained['regressor']
         
-        # Log regression metrics
-        print("\n Logging regression metrics...")
-        mlflow.log_metric("r2", reg_metrics['r2'])
-        mlflow.log_metric("mae", reg_metrics['mae'])
-        mlflow.log_metric("rmse", reg_metrics['rmse'])
+        # Metrics (unprefixed scores; class_/reg_ early stopping info)
+        stopping = ('best_iteration', 'n_iter', 'best_val_loss')
+        for metrics, prefix in ((class_metrics, "class_"), (reg_metrics, "reg_")):
+            tracker.log_metrics({k: v for k, v in metrics.items() if k not in stopping})
+            tracker.log_metrics({k: v for k, v in metrics.items() if k in stopping}, prefix=prefix)
         
-        # Create and log artifacts (plots)
-        print("\nCreating and logging artifacts...")
+        # Plots, model pickles and MLflow model directories are written and
+        # uploaded by the tracker's worker thread while this one continues
         os.makedirs("artifacts", exist_ok=True)
+        tracker.log_plot(plot_confusion_matrix, class_metrics['y_true'], class_metrics['y_pred'],
+                         save_path="artifacts/confusion_matrix.png")
+        tracker.log_plot(plot_roc_curve, class_metrics['y_true'], class_metrics['y_proba'],
+                         save_path="artifacts/roc_curve.png")
+        tracker.log_plot(plot_predictions, reg_metrics['y_true'], reg_metrics['y_pred'],
+                         save_path="artifacts/predicted_vs_actual.png")
+        tracker.log_model(classifier, "classifier")
+        tracker.log_model(regressor, "regressor")
         
-        # Confusion matrix
-        cm_path = plot_confusion_matrix(
-            class_metrics['y_true'], 
-            class_metrics['y_pred'],
-            "artifacts/confusion_matrix.png"
-        )
-        mlflow.log_artifact(cm_path)
-        
-        # ROC curve
-        roc_path = plot_roc_curve(
-            class_metrics['y_true'],
-            class_metrics['y_proba'],
-            "artifacts/roc_curve.png"
-        )
-        mlflow.log_artifact(roc_path)
-        
-        # Predicted vs Actual
-        pred_path = plot_predictions(
-            reg_metrics['y_true'],
-            reg_metrics['y_pred'],
-            "artifacts/predicted_vs_actual.png"
-        )
-        mlflow.log_artifact(pred_path)
-        
-        # Save and log models
+        training_data = {
+            'hash': data_hash(splits['X_train'], splits['y_class_train'], splits['y_reg_train']),
+            'rows': len(splits['X_train']),
+            'from': str(splits['train_window'][0].date()), 'to': str(splits['train_window'][1].date())
+        }
+        history = [
+            stage_record(name, model, config[task]["model_type"], "full",
+                         splits['train_window'], len(splits['X_train']),
+                         data_hash=training_data['hash'])
+            for name, model, task in (("classifier", classifier, "classification"),
+                                      ("regressor", regressor, "regression"))
+        ]
         model_path = save_models(
             classifier, regressor, 
             splits['scaler'], splits['feature_cols'], 
-            config
+            config, feature_store=feature_store, transformer=splits.get('transformer'),
+            history=history, training_data=training_data
         )
-        mlflow.log_artifact(model_path)
-        
-        # Log models to MLFlow model registry
-        mlflow.sklearn.log_model(classifier, "classifier")
-        mlflow.sklearn.log_model(regressor, "regressor")
+        tracker.log_artifact(model_path)
         
-        print("\n✓ MLFlow run complete!")
-        print(f"  Run ID: {mlflow.active_run().info.run_id}")
+        critical = time.perf_counter() - start
+        tracker.log_metrics({"experiment_wall_seconds": critical})
+        waited = tracker.flush()
+        print(f"\n✓ MLFlow run complete! ({critical:.1f}s end to end, "
+              f"{waited:.1f}s waiting on artifact logging)")
+        print(f"  Run ID: {tracker.run_id}")
         
-        return classifier, regressor, class_metrics, reg_metrics
\ No newline at end of file
+        return classifier, regressor, class_metrics, reg_metrics
@@ -0,0 +1,141 @@
+"""
+Feature Transformer - Request dicts/records to scaled model input, without pandas
+"""
+import numpy as np
+
+
+def category_key(value):
+    """Normalized category label ('Staten_Island' -> 'staten island')."""
+    return str(value).strip().lower().replace('_', ' ')
+
+
+class FeatureTransformer:
+    """Compiled form of the training feature layout and scaler.
+
+    Holds a fixed column -> index map, the scaler's mean/scale arrays and the
+    slot of each one-hot category, so a request dict (or a batch of records)
+    becomes a contiguous float array directly. Missing features are 0 before
+    scaling, as with the old DataFrame path, or NaN (`missing`) for models
+    that handle missing values natively.
+
+    With geo_encoding "code", a categorical is one `{name}_code` column
+    instead; `codes` holds its category list, and the column is passed
+    through unscaled (-1 for missing/unknown, as native categorical models
+    expect).
+    """
+
+    def __init__(self, feature_cols, mean, scale, categorical=('borough',), codes=None,
+                 missing=0.0):
+        self.feature_cols = list(feature_cols)
+        self.missing = missing
+        self.column_index = {col: i for i, col in enumerate(self.feature_cols)}
+        self.mean = np.array(mean, dtype=np.float64)
+        self.scale = np.array(scale, dtype=np.float64)
+
+        # Integer-coded categoricals: {'borough': (slot, {'bronx': 0, ...})}
+        self.codes = {}
+        for name, categories in (codes or {}).items():
+            slot = self.column_index.get(f"{name}_code")
+            if slot is not None:
+                self.codes[name] = (slot, {category_key(c): i for i, c in enumerate(categories)})
+                self.mean[slot], self.scale[slot] = 0.0, 1.0
+        self.code_slots = [slot for slot, _ in self.codes.values()]
+
+        # One-hot slots: {'borough': {'bronx': 3, 'staten island': 7, ...}}
+        self.one_hot = {}
+        for name in categorical:
+            if name in self.codes:
+                continue
+            prefix = f"{name}_"
+            self.one_hot[name] = {
+                category_key(col[len(prefix):]): i
+                for i, col in enumerate(self.feature_cols) if col.startswith(prefix)
+            }
+
+    @property
+    def categorical_features(self):
+        """Indices of integer-coded columns (for native categorical support)."""
+        return list(self.code_slots)
+
+    @classmethod
+    def from_scaler(cls, feature_cols, scaler, categorical=('borough',), codes=None,
+                    missing=0.0):
+        """Build from a fitted StandardScaler (or None for no scaling)."""
+        n = len(feature_cols)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        return cls(
+            feature_cols,
+            np.zeros(n) if mean is None else mean,
+            np.ones(n) if scale is None else scale,
+            categorical, codes, missing
+        )
+
+    def describe(self):
+        """JSON-serializable layout (everything but the mean/scale arrays).
+
+        `missing` is None when missing values are left as NaN.
+        """
+        return {
+            'feature_cols': self.feature_cols,
+            'categorical': list(self.one_hot) + list(self.codes),
+            'codes': {
+                name: sorted(mapping, key=mapping.get) for name, (_, mapping) in self.codes.items()
+            },
+            'missing': None if self.missing != self.missing else float(self.missing)
+        }
+
+    @classmethod
+    def from_description(cls, description, mean, scale):
+        """Rebuild from describe() output and the mean/scale arrays."""
+        missing = description['missing']
+        return cls(
+            description['feature_cols'], mean, scale, description['categorical'],
+            description['codes'], np.nan if missing is None else missing
+        )
+
+    def fill_row(self, row, record):
+        """Write one record's raw (unscaled) values into `row`."""
+        index = self.column_index
+        for key, value in record.items():
+            coded = self.codes.get(key)
+            if coded is not None:
+                row[coded[0]] = coded[1].get(category_key(value), -1)
+                continue
+            slots = self.one_hot.get(key)
+            if slots is not None:
+                slot = slots.get(category_key(value))
+                if slot is not None:
+                    row[slot] = 1.0
+                continue
+            i = index.get(key)
+            if i is not None and value is not None and value == value:
+                row[i] = value
+
+    def transform(self, records):
+        """Scaled (n_records, n_features) array from a dict or list of dicts."""
+        if isinstance(records, dict):
+            records = (records,)
+        X = np.full((len(records), len(self.feature_cols)), self.missing)
+        X[:, self.code_slots] = np.nan
+        for row, record in zip(X, records):
+            self.fill_row(row, record)
+        return self.transform_matrix(X)
+
+    def scale_inplace(self, X):
+        """Standardize a raw matrix in place, keeping its dtype."""
+        X -= self.mean.astype(X.dtype)
+        X /= self.scale.astype(X.dtype)
+        return X
+
+    def transform_matrix(self, X):
+        """Scale a raw matrix already in feature_cols order (NaN -> missing, or -1 for codes)."""
+        X = np.array(X, dtype=np.float64, order='C')
+        if self.code_slots:
+            codes = X[:, self.code_slots]
+            X[:, self.code_slots] = np.where(np.isnan(codes), -1, codes)
+        if self.missing == self.missing:
+            np.nan_to_num(X, copy=False, nan=self.missing)
+        X -= self.mean
+        X /= self.scale
+        return X
@@ -0,0 +1,189 @@
+"""
+Hyperparameter Tuning - Successive halving over the year splits, in a process pool
+"""
+import os
+import time
+import yaml
+import numpy as np
+import mlflow
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import roc_auc_score, r2_score
+from threadpoolctl import threadpool_limits
+from data_loader import load_config
+from engines import make_model, get_engine
+from main import prepare_training_data
+
+TASKS = {
+    "classification": ('y_class', 'auroc'),
+    "regression": ('y_reg', 'r2'),
+}
+
+# Set in each worker by init_worker: the shared matrix and the targets
+_WORKER = {}
+
+
+def sample_space(space, n, rng):
+    """Draw n parameter dicts from a search space.
+    
+    A list is a choice; {low, high} is uniform (integer if both bounds are
+    integers), or log-uniform with log: true.
+    """
+    candidates = []
+    for _ in range(n):
+        params = {}
+        for name, spec in space.items():
+            if isinstance(spec, dict):
+                low, high = spec["low"], spec["high"]
+                if spec.get("log"):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                elif isinstance(low, int) and isinstance(high, int):
+                    value = int(rng.integers(low, high + 1))
+                else:
+                    value = float(rng.uniform(low, high))
+            else:
+                value = spec[rng.integers(len(spec))]
+            params[name] = value
+        candidates.append(params)
+    return candidates
+
+
+def shared_matrix(splits, tuning_dir):
+    """Path of an on-disk .npy holding the split matrix (written if needed)."""
+    if splits.get('matrix_path'):
+        return splits['matrix_path']
+    os.makedirs(tuning_dir, exist_ok=True)
+    path = os.path.join(tuning_dir, "X.npy")
+    np.save(path, splits['X'])
+    return path
+
+
+def init_worker(matrix_path, bounds, targets, categorical_features):
+    """Open the shared matrix read-only; one BLAS/OpenMP thread per worker."""
+    threadpool_limits(limits=1)
+    X = np.load(matrix_path, mmap_mode='r')
+    n_train, n_val, _ = bounds
+    _WORKER.update(
+        X_train=X[:n_train], X_val=X[n_train:n_train + n_val],
+        targets=targets, categorical_features=categorical_features
+    )
+
+
+def evaluate(task, model_type, params, rounds):
+    """Fit one candidate for `rounds` boosting rounds; return (val score, seconds)."""
+    target, _ = TASKS[task]
+    start = time.perf_counter()
+    
+    model = make_model({"model_type": model_type, "params": {**params, "n_estimators": rounds}},
+                       _WORKER['categorical_features'])
+    if 'early_stopping' in model.get_params():
+        model.set_params(early_stopping=False)  # the rung fixes the rounds
+    model.fit(_WORKER['X_train'], _WORKER['targets'][f'{target}_train'])
+    
+    y_val = _WORKER['targets'][f'{target}_val']
+    if task == "classification":
+        score = roc_auc_score(y_val, model.predict_proba(_WORKER['X_val'])[:, 1])
+    else:
+        score = r2_score(y_val, model.predict(_WORKER['X_val']))
+    return score, time.perf_counter() - start
+
+
+def successive_halving(pool, task, task_config, tuning):
+    """Race sampled candidates, keeping the best 1/factor at each rung.
+    
+    Rung r trains every survivor for min_rounds * factor**r rounds (capped
+    at max_rounds). Each trial is logged as a nested MLflow run.
+    
+    Returns:
+        (all trial dicts, the winning trial)
+    """
+    model_type = task_config["model_type"]
+    if get_engine(model_type).get("iterations") is None:
+        raise ValueError(f"Tuning races boosting rounds; {model_type} has none")
+    
+    _, metric = TASKS[task]
+    rng = np.random.default_rng(tuning.get("seed", 42))
+    base = {k: v for k, v in (task_config.get("params") or {}).items() if k != "n_estimators"}
+    candidates = [{**base, **params} for params in
+                  sample_space(tuning["search_space"][task], tuning.get("n_candidates", 27), rng)]
+    factor = tuning.get("factor", 3)
+    rounds = tuning.get("min_rounds", 20)
+    max_rounds = tuning.get("max_rounds", 500)
+    
+    trials, rung = [], 0
+    while True:
+        start = time.perf_counter()
+        futures = [pool.submit(evaluate, task, model_type, params, rounds) for params in candidates]
+        results = [future.result() for future in futures]
+        print(f"  {task} rung {rung}: {len(candidates)} candidates x {rounds} rounds "
+              f"in {time.perf_counter() - start:.1f}s (best val {metric} "
+              f"{max(score for score, _ in results):.4f})")
+        
+        rung_trials = []
+        for i, (params, (score, seconds)) in enumerate(zip(candidates, results)):
+            trial = {'task': task, 'rung': rung, 'rounds': rounds, 'params': params,
+                     'score': score, 'seconds': seconds}
+            with mlflow.start_run(run_name=f"{task}_r{rung}_{i}", nested=True):
+                mlflow.log_params({**params, "n_estimators": rounds, "rung": rung, "task": task})
+                mlflow.log_metric(f"val_{metric}", score)
+                mlflow.log_metric("fit_seconds", seconds)
+            rung_trials.append(trial)
+        trials += rung_trials
+        
+        if len(candidates) <= 1 or rounds >= max_rounds:
+            break
+        ranked = sorted(rung_trials, key=lambda t: t['score'], reverse=True)
+        candidates = [t['params'] for t in ranked[:max(1, len(candidates) // factor)]]
+        rounds = min(rounds * factor, max_rounds)
+        rung += 1
+    
+    return trials, max(rung_trials, key=lambda t: t['score'])
+
+
+def run_tuning(config_path=None):
+    """Tune classification and regression params on the validation year.
+    
+    Candidates fan out over a process pool whose workers memory-map the
+    prepared feature matrix instead of receiving a pickled copy. The
+    winners are printed, written to tuning.output and logged to MLflow.
+    """
+    print("FROM AIR TO CARE - HYPERPARAMETER TUNING")
+    config = load_config(config_path)
+    tuning = config["tuning"]
+    
+    splits, _ = prepare_training_data(config)
+    matrix_path = shared_matrix(splits, tuning.get("dir", "data/tuning"))
+    targets = {
+        f'{target}_{part}': splits[f'{target}_{part}'].to_numpy()
+        for target, _ in TASKS.values() for part in ('train', 'val')
+    }
+    
+    mlflow_config = config["mlflow"]
+    mlflow.set_tracking_uri(mlflow_config["tracking_uri"])
+    mlflow.set_experiment(mlflow_config["experiment_name"])
+    
+    max_workers = tuning.get("max_workers") or os.cpu_count()
+    best_params = {}
+    start = time.perf_counter()
+    with mlflow.start_run(run_name="tuning"), ProcessPoolExecutor(
+        max_workers=max_workers, initializer=init_worker,
+        initargs=(matrix_path, splits['bounds'], targets, splits['categorical_features'])
+    ) as pool:
+        mlflow.log_params({"n_candidates": tuning.get("n_candidates", 27),
+                           "factor": tuning.get("factor", 3), "max_workers": max_workers})
+        for task in tuning.get("tasks", list(TASKS)):
+            trials, best = successive_halving(pool, task, config[task], tuning)
+            _, metric = TASKS[task]
+            best_params[task] = {**best['params'], "n_estimators": best['rounds']}
+            mlflow.log_metric(f"{task}_best_val_{metric}", best['score'])
+            mlflow.log_metric(f"{task}_trials", len(trials))
+            print(f"✓ {task}: best val {metric} {best['score']:.4f} with {best_params[task]}")
+        
+        output = tuning.get("output", "models/best_params.yaml")
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, 'w') as f:
+            yaml.safe_dump(best_params, f, sort_keys=False)
+        mlflow.log_artifact(output)
+    
+    print(f"\n✓ Tuning complete in {time.perf_counter() - start:.1f}s "
+          f"({max_workers} workers); best params written to {output}")
+    return best_params